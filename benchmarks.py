@@ -0,0 +1,453 @@
+import argparse
+import contextlib
+import importlib.machinery
+import importlib.util
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import simulationv2
+from cache import ResultCache
+from checkpoints import loadResults, runCheckpointed
+from cli import buildScenarios, expandPreset, makeParser
+from output import Output, ROUNDS
+from payoffs import SAMPLE_PAYOFF, FunctionPayoff
+from rounds import (IncrementalEvaluator, findEquilibrium, runMultipleRounds, runBatchRounds, SAMPLE_WEIGHTS,
+                    SAMPLE_BIAS)
+from stores import BlockRelationships, getRelationshipMatrix, getReputationVector, relationshipMatrix
+from sweep import PARTS
+from thresholds import bonusThresholds, reputationFloorThresholds
+
+# largest n the engines that go through every subset (2^(n-1) of them) are timed and checked at
+BRUTE_FORCE_LIMIT = 14
+# number of blocs the BlockRelationships cases split the nations into
+BLOCS = 4
+# population sizes and numbers of rounds timed by default
+DEFAULT_SIZES = (4, 8, 12, 14, 64, 256)
+DEFAULT_ROUNDS = (10,)
+# a case is flagged when it is this many times slower than in the baseline
+REGRESSION_THRESHOLD = 1.25
+# cases faster than this (seconds) are too noisy to flag
+NOISE_FLOOR = 0.002
+
+# population size of the behaviour checks that compare against brute force, see behaviourChecks
+BEHAVIOUR_N = 6
+
+# how far each engine's expected utilities may be from the brute force ones ("subsets"). Every engine rounds to two
+# decimals like the brute force, so ties can round the other way; float32 and sampling are only approximate
+TOLERANCES = {
+    "polynomial": 0.011,
+    "getExpectedUtilityCooperatingMech[subsets]": 0.011,
+    "getExpectedUtilityCooperatingMech[polynomial]": 0.011,
+    "montecarlo": 1.0,  # in units of five standard errors (plus rounding), see crossCheck
+    "allNations[float64]": 0.011,
+    "allNations[longdouble]": 0.011,
+    "allNations[float32]": 0.5,
+    "allNations[logSpace]": 0.011,
+    "allNations[blocks]": 0.011,
+    "batchRounds": 0.0,
+}
+
+def measure(function, repeat=3):
+    '''
+    :param function: function with no arguments to time
+    :param repeat: number of timed calls
+    :return: (seconds, peakBytes): the fastest of the timed calls, and the most memory allocated at once during one
+    more call made with tracemalloc on (kept apart from the timed calls, which it would slow down)
+    '''
+    seconds = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peakBytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peakBytes
+
+def useGlobals(reputations, relationships):
+    '''
+    Sets the module globals of simulationv2 that getExpectedUtilityCooperating and the other original functions read.
+    '''
+    simulationv2.reputations = reputations
+    simulationv2.relationships = relationships
+    simulationv2.invalidateProbabilities()
+
+def loadSampleSimulation():
+    '''
+    :return: the SampleSimulation script as a module. Its file has no .py extension, so it is loaded from its path
+    '''
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SampleSimulation")
+    loader = importlib.machinery.SourceFileLoader("SampleSimulation", path)
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(module)
+    return module
+
+def getBlockRelationships(n, rng, blocs=BLOCS):
+    '''
+    :param n: number of players / nations
+    :param rng: numpy random generator
+    :param blocs: number of blocs
+    :return: BlockRelationships with every nation's bloc and the relationships between blocs drawn from rng (in the
+    same range as the other cases), and one pair with its own value, so both kinds of groups are used
+    '''
+    values = np.triu(rng.uniform(-0.5, 0.2, (blocs, blocs)))
+    values = values + np.triu(values, 1).T
+    overrides = {(0, 1): 0.1} if n > 1 else {}
+    return BlockRelationships(rng.integers(0, blocs, n), values, overrides)
+
+class GroupedSimulation(simulationv2.Simulation):
+    '''
+    Simulation that always takes the grouped pass over BlockRelationships, so crossCheck covers it at the small sizes
+    where usesGroups would expand them instead
+    '''
+
+    def usesGroups(self):
+        return True
+
+def benchmarkCases(n, numRounds, seed=0):
+    '''
+    :param n: number of players / nations
+    :param numRounds: number of rounds for the cases that play rounds
+    :param seed: random seed for the reputations and relationships
+    :return: list of (name, function): everything timed at this n. Engines that go through every subset (including
+    SampleSimulation's run_multiple_rounds) are left out above BRUTE_FORCE_LIMIT
+    '''
+    rng = np.random.default_rng(seed)
+    relationships = getRelationshipMatrix(n, -0.5, 0.2, rng)
+    reputations = getReputationVector(n, 0, 0.3, rng)
+    blockRelationships = getBlockRelationships(n, rng)
+    quiet = Output()
+    cases = []
+
+    def everyNation(function, method):
+        def run():
+            useGlobals(reputations, relationships)
+            return [function(i, n, method=method, output=quiet) for i in range(n)]
+        return run
+
+    for method in simulationv2.METHODS:
+        if method == "subsets" and n > BRUTE_FORCE_LIMIT:
+            continue
+        cases.append((f"getExpectedUtilityCooperating[{method}]",
+                      everyNation(simulationv2.getExpectedUtilityCooperating, method)))
+        cases.append((f"getExpectedUtilityCooperatingMech[{method}]",
+                      everyNation(simulationv2.getExpectedUtilityCooperatingMech, method)))
+        cases.append((f"getExpectedUtilityDefecting[{method}]",
+                      everyNation(simulationv2.getExpectedUtilityDefecting, method)))
+
+    for precision in simulationv2.PRECISIONS:
+        cases.append((f"expectedUtilitiesAllNations[{precision}]",
+                      lambda precision=precision: simulationv2.Simulation(
+                          reputations, relationships, precision=precision).expectedUtilitiesAllNations()))
+    cases.append(("expectedUtilitiesAllNations[logSpace]",
+                  lambda: simulationv2.Simulation(reputations, relationships, logSpace=True).expectedUtilitiesAllNations()))
+    cases.append(("expectedUtilitiesAllNations[blocks]",
+                  lambda: simulationv2.Simulation(reputations, blockRelationships).expectedUtilitiesAllNations()))
+
+    if n <= BRUTE_FORCE_LIMIT:
+        cases.append(("get_combinations", lambda: simulationv2.get_combinations(list(range(1, n)))))
+    cases.append(("getRelationships", lambda: simulationv2.getRelationships(n, 0.2, -0.5, np.random.default_rng(seed))))
+    cases.append(("getRelationshipMatrix", lambda: getRelationshipMatrix(n, -0.5, 0.2, np.random.default_rng(seed))))
+
+    cases.append((f"runMultipleRounds[{numRounds}]",
+                  lambda: runMultipleRounds(reputations, relationships, numRounds, output=quiet)))
+    cases.append((f"runBatchRounds[{numRounds}]",
+                  lambda: runBatchRounds(reputations[np.newaxis], relationships, numRounds)))
+
+    if n <= BRUTE_FORCE_LIMIT:
+        sample = loadSampleSimulation()
+        sampleRelationships = {i: row for i, row in enumerate(relationships.tolist())}
+        sampleReputations = dict(enumerate(reputations.tolist()))
+
+        def sampleRounds():
+            # run_multiple_rounds prints every decision and changes the reputations it is given
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                return sample.run_multiple_rounds(n, list(range(n)), sampleRelationships, dict(sampleReputations),
+                                                  numRounds)
+        cases.append((f"run_multiple_rounds[{numRounds}]", sampleRounds))
+    return cases
+
+def crossCheck(n, numRounds, seed=0):
+    '''
+    :param n: number of players / nations, at most BRUTE_FORCE_LIMIT
+    :param numRounds: number of rounds for checking runBatchRounds
+    :param seed: random seed for the reputations and relationships
+    :return: list of checks, dicts with the engine, n, its largest difference from the brute force results, the
+    tolerance and whether it passed
+
+    The brute force results are Simulation.expectedUtility with method "subsets", for cooperating (with and without
+    the global support mechanism) and defecting. getExpectedUtilityCooperatingMech is checked against the ones with
+    the mechanism, and the grouped pass of BlockRelationships against the brute force results of the same
+    relationships as a full matrix. runBatchRounds is checked against runMultipleRounds instead.
+    '''
+    simulation = simulationv2.Simulation.generate(n, seed=seed)
+    nations = range(n)
+    choices = ((0, False), (0, True), (1, False))
+    expected = np.array([[simulation.expectedUtility(i, choice, "subsets", mech) for i in nations]
+                         for choice, mech in choices])
+    errors = {}
+
+    polynomial = np.array([[simulation.expectedUtility(i, choice, "polynomial", mech) for i in nations]
+                           for choice, mech in choices])
+    errors["polynomial"] = np.abs(polynomial - expected).max()
+
+    for mode, options in (("float64", {}), ("longdouble", {"precision": "longdouble"}),
+                          ("float32", {"precision": "float32"}), ("logSpace", {"logSpace": True})):
+        engine = simulationv2.Simulation(simulation.reputations, simulation.relationships, **options)
+        actual = np.array([engine.expectedUtilitiesForChoice(choice, mech) for choice, mech in choices], dtype=np.float64)
+        errors[f"allNations[{mode}]"] = np.abs(actual - expected).max()
+
+    useGlobals(simulation.reputations, simulation.relationships)
+    for method in ("subsets", "polynomial"):
+        actual = np.array([simulationv2.getExpectedUtilityCooperatingMech(i, n, method=method, output=Output())
+                           for i in nations])
+        errors[f"getExpectedUtilityCooperatingMech[{method}]"] = np.abs(actual - expected[1]).max()
+
+    blockRelationships = getBlockRelationships(n, np.random.default_rng(seed))
+    dense = simulationv2.Simulation(simulation.reputations, relationshipMatrix(blockRelationships))
+    blockExpected = np.array([[dense.expectedUtility(i, choice, "subsets", mech) for i in nations]
+                              for choice, mech in choices])
+    grouped = GroupedSimulation(simulation.reputations, blockRelationships)
+    actual = np.array([grouped.expectedUtilitiesForChoice(choice, mech) for choice, mech in choices])
+    errors["allNations[blocks]"] = np.abs(actual - blockExpected).max()
+
+    checks = [{"engine": engine, "n": n, "maxError": float(error), "tolerance": TOLERANCES[engine],
+               "passed": bool(error <= TOLERANCES[engine])} for engine, error in errors.items()]
+
+    # sampling: the combinations sum should be within a few standard errors of the exact one
+    worst = 0.0
+    for i in nations:
+        others = [j for j in nations if j != i]
+        for choice, mech in choices:
+            estimate, standardError = simulation.combinationsMonteCarlo(i, others, choice, mech)
+            exact = simulation.combinationsPolynomial(i, others, choice, mech)
+            worst = max(worst, abs(estimate - exact) / (5 * standardError + 0.01))
+    checks.append({"engine": "montecarlo", "n": n, "maxError": worst, "tolerance": TOLERANCES["montecarlo"],
+                   "passed": bool(worst <= TOLERANCES["montecarlo"])})
+
+    _, history = runMultipleRounds(simulation.reputations, simulation.relationships, numRounds, output=Output())
+    _, batchHistory = runBatchRounds(simulation.reputations[np.newaxis], simulation.relationships, numRounds)
+    error = np.abs(batchHistory[0] - history).max()
+    checks.append({"engine": "batchRounds", "n": n, "maxError": float(error), "tolerance": TOLERANCES["batchRounds"],
+                   "passed": bool(error <= TOLERANCES["batchRounds"])})
+    return checks
+
+class _Interrupt(Exception):
+    pass
+
+class _InterruptingOutput(Output):
+    '''
+    Silent output that raises _Interrupt when round stopAt starts, to stop a run the way a crash would.
+    '''
+    detail = ROUNDS
+
+    def __init__(self, stopAt):
+        self.stopAt = stopAt
+
+    def write(self, kind, fields):
+        if kind == "round" and fields["round"] == self.stopAt:
+            raise _Interrupt()
+
+def _check(engine, n, failures):
+    '''
+    :return: a check (see crossCheck) for a behaviour that either holds or doesn't: failures is how many of its
+    conditions failed, and it passes only when there are none
+    '''
+    return {"engine": engine, "n": n, "maxError": float(failures), "tolerance": 0.0, "passed": bool(failures == 0)}
+
+def behaviourChecks(seed=0, n=BEHAVIOUR_N):
+    '''
+    :param seed: random seed for the reputations and relationships
+    :param n: number of nations for the checks against brute force
+    :return: list of checks (see crossCheck) of what the solvers, checkpoints, cache and command line promise, each
+    counting the conditions that failed:
+
+    findEquilibrium converges to a profile where every nation plays its best response (learningRate 0), and catches
+    the 2-cycle of two nations that each cooperate only against a defector. bonusThresholds and
+    reputationFloorThresholds agree with the brute force utilities ("subsets") just above and below each threshold.
+    runCheckpointed gives the same results when interrupted and resumed as when it runs through. ResultCache hits,
+    evicts the least recently used result, finds evicted results on disk and still returns results it keeps none of.
+    buildScenarios expands presets under the flags and copies them per seed.
+    '''
+    quiet = Output()
+    simulation = simulationv2.Simulation.generate(n, seed=seed)
+    checks = []
+
+    profile, iterations, converged, cycleLength = findEquilibrium(simulation.reputations, simulation.relationships,
+                                                                  learningRate=0, output=quiet)
+    evaluator = IncrementalEvaluator(simulation.reputations, simulation.relationships, SAMPLE_WEIGHTS, SAMPLE_BIAS,
+                                     payoff=SAMPLE_PAYOFF)
+    responses = np.array([evaluator.decide(i)[2] for i in range(n)])
+    checks.append(_check("findEquilibrium[converged]", n, (not converged) + (cycleLength != 0) + (iterations != 2)
+                         + int(np.count_nonzero(responses != profile))))
+
+    # cooperating pays 20 when the other nation defects and 10 when it doesn't, defecting always pays 10. A nation
+    # cooperates while the other's reputation is low, which raises it, so both switch every round
+    antiCoordination = FunctionPayoff(lambda k: (10, 20, 0)[k], lambda k: 10)
+    _, iterations, converged, cycleLength = findEquilibrium([0.5, 0.5], np.zeros((2, 2)), maxIterations=20,
+                                                            learningRate=0.25, weights=(5, 1, 1), bias=-2.5,
+                                                            output=quiet, payoff=antiCoordination)
+    checks.append(_check("findEquilibrium[cycle]", 2, converged + (cycleLength != 2) + (iterations >= 20)))
+
+    tolerance = 0.01
+    thresholds, _, _ = bonusThresholds(simulation, tolerance=tolerance)
+    failures = 0
+    for i, threshold in enumerate(thresholds):
+        for bonus, cooperates in ((threshold, True), (threshold - tolerance, False)):
+            if np.isfinite(bonus) and bonus >= 0:
+                bonused = simulationv2.Simulation(simulation.reputations, simulation.relationships, bonus=bonus)
+                failures += (bonused.expectedUtility(i, 0, "subsets", mech=True) >
+                             bonused.expectedUtility(i, 1, "subsets")) != cooperates
+    checks.append(_check("bonusThresholds", n, failures))
+
+    tolerance = 0.001
+    thresholds, _, _ = reputationFloorThresholds(simulation.reputations, simulation.relationships, tolerance=tolerance)
+    failures = 0
+    for i, threshold in enumerate(thresholds):
+        for floor, cooperates in ((min(threshold, 1), np.isfinite(threshold)), (threshold - tolerance, False)):
+            if np.isfinite(floor) and floor >= 0:
+                floored = simulationv2.Simulation(np.maximum(simulation.reputations, floor), simulation.relationships)
+                failures += (floored.expectedUtility(i, 0, "subsets") >
+                             floored.expectedUtility(i, 1, "subsets")) != cooperates
+    checks.append(_check("reputationFloorThresholds", n, failures))
+
+    with tempfile.TemporaryDirectory() as directory:
+        straight, resumed = os.path.join(directory, "straight"), os.path.join(directory, "resumed")
+        reputations, _ = runCheckpointed(simulation.reputations, simulation.relationships, 8, straight,
+                                         checkpointEvery=3, output=quiet, recordReputations=True)
+        interrupted = False
+        try:
+            runCheckpointed(simulation.reputations, simulation.relationships, 8, resumed, checkpointEvery=3,
+                            output=_InterruptingOutput(5), recordReputations=True)
+        except _Interrupt:
+            interrupted = True
+        resumedReputations, roundNum = runCheckpointed(simulation.reputations, simulation.relationships, 8, resumed,
+                                                       checkpointEvery=3, output=quiet, recordReputations=True)
+        failures = (not interrupted) + (roundNum != 8) + (not np.array_equal(reputations, resumedReputations))
+        for column in ("cooperation", "decisions", "reputations"):
+            failures += not np.array_equal(loadResults(straight, column), loadResults(resumed, column))
+    checks.append(_check("runCheckpointed[resume]", n, failures))
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory, maxEntries=2)
+        for key in "abc":
+            cache.put(key, {"value": [ord(key)]})
+            if key == "b":
+                cache.get("a")
+        # a was used after b, so b is the one evicted from memory, and found on disk
+        failures = (len(cache) != 2) + (cache.memoryHits != 1)
+        failures += (cache.get("b")["value"][0] != ord("b")) + (cache.diskHits != 1) + (cache.memoryHits != 1)
+        failures += (cache.get("missing") is not None) + (cache.misses != 1)
+        empty = ResultCache(maxEntries=0)
+        failures += empty.fetch("a", lambda: {"value": [1]})["value"][0] != 1
+        failures += len(empty) != 0
+    checks.append(_check("ResultCache", None, failures))
+
+    scenarios = buildScenarios(makeParser().parse_args(["run", "--preset", "part2", "part4", "--n", "7",
+                                                        "--seeds", "1", "2"]))
+    failures = [scenario["name"] for scenario in scenarios] != ["part2-seed1", "part2-seed2", "part4-seed1",
+                                                                "part4-seed2"]
+    for scenario in scenarios:
+        preset = PARTS[scenario["name"].split("-")[0]]
+        failures += any(scenario[key] != value for key, value in preset.items())
+        failures += (scenario["n"] != 7) + ("preset" in scenario)
+    failures += expandPreset({"preset": "part4", "bonus": 0})["bonus"] != 0
+    checks.append(_check("buildScenarios", None, failures))
+    return checks
+
+def runBenchmarks(sizes=DEFAULT_SIZES, roundsList=DEFAULT_ROUNDS, repeat=3, seed=0, output=None):
+    '''
+    :param sizes: numbers of players / nations to time
+    :param roundsList: numbers of rounds to time the round engines at
+    :param repeat: number of timed calls per case (the fastest one is kept)
+    :param seed: random seed for the reputations and relationships
+    :param output: open text file to report progress to, one line per case (nothing by default)
+    :return: dict with the environment, the results (case, n, rounds, seconds, peakBytes) and the checks (see
+    crossCheck and behaviourChecks), ready to be saved as JSON
+    '''
+    results = []
+    checks = []
+    for n in sizes:
+        for numRounds in roundsList:
+            for name, function in benchmarkCases(n, numRounds, seed):
+                if numRounds != roundsList[0] and "rounds[" not in name.lower():
+                    # only the round engines depend on the number of rounds
+                    continue
+                seconds, peakBytes = measure(function, repeat)
+                results.append({"case": name, "n": n, "rounds": numRounds, "seconds": seconds, "peakBytes": peakBytes})
+                if output is not None:
+                    print(f"{name:45} n={n:<6} {seconds * 1000:10.3f} ms {peakBytes / 2 ** 20:10.2f} MiB", file=output)
+        if n <= BRUTE_FORCE_LIMIT:
+            checks.extend(crossCheck(n, roundsList[0], seed))
+    checks.extend(behaviourChecks(seed))
+
+    environment = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                   "processor": platform.processor(), "system": platform.system()}
+    return {"environment": environment, "results": results, "checks": checks}
+
+def compareResults(current, baseline, threshold=REGRESSION_THRESHOLD, noiseFloor=NOISE_FLOOR):
+    '''
+    :param current: results from runBenchmarks
+    :param baseline: earlier results from runBenchmarks (for example loaded from a baseline file)
+    :param threshold: how many times slower than the baseline a case has to be to be flagged
+    :param noiseFloor: cases faster than this many seconds in both runs are never flagged
+    :return: list of regressions, dicts with the case, n, rounds, both times and their ratio
+    '''
+    before = {(result["case"], result["n"], result["rounds"]): result["seconds"] for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        key = (result["case"], result["n"], result["rounds"])
+        if key not in before or max(result["seconds"], before[key]) < noiseFloor:
+            continue
+        ratio = result["seconds"] / before[key]
+        if ratio > threshold:
+            regressions.append({"case": key[0], "n": key[1], "rounds": key[2], "baseline": before[key],
+                                "seconds": result["seconds"], "ratio": ratio})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time every engine over a range of population sizes, check them "
+                                                 "against brute force, and compare with a baseline.")
+    parser.add_argument("--n", type=int, nargs="+", default=list(DEFAULT_SIZES), help="numbers of nations")
+    parser.add_argument("--rounds", type=int, nargs="+", default=list(DEFAULT_ROUNDS), help="numbers of rounds")
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls per case (the fastest is kept)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--baseline", help="JSON file from an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown (times the baseline) that counts as a regression")
+    parser.add_argument("--output", help="JSON file to save the results to, for use as a later baseline")
+    args = parser.parse_args(argv)
+
+    current = runBenchmarks(args.n, args.rounds, args.repeat, args.seed, sys.stdout)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=1)
+
+    failed = [check for check in current["checks"] if not check["passed"]]
+    for check in failed:
+        print(f"Check failed: {check['engine']} at n={check['n']} is off by {check['maxError']} "
+              f"(tolerance {check['tolerance']})")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compareResults(current, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression['case']} at n={regression['n']} took {regression['seconds'] * 1000:.3f} ms, "
+                  f"{regression['ratio']:.2f} times the baseline's {regression['baseline'] * 1000:.3f} ms")
+
+    return 1 if failed or regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
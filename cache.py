@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+# part of every key, so results cached by an older version of the simulation are not reused after it changes
+CACHE_VERSION = 1
+
+def hashKey(settings):
+    '''
+    :param settings: map of JSON-like values (numbers, strings, lists, tuples and maps) describing what was computed
+    :return: a stable hex hash of settings: the same on every run and machine, and independent of the order of keys
+    '''
+    text = json.dumps([CACHE_VERSION, settings], sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+def resultSize(results):
+    '''
+    :return: number of bytes used by a map of arrays
+    '''
+    return sum(np.asarray(value).nbytes for value in results.values())
+
+class ResultCache:
+    '''
+    Results (maps of arrays, like sweep.scenarioResults gives) by key (see hashKey), in two tiers: the most recently
+    used ones in memory, and all of them as .npz files in a directory, if one is given. Both tiers have a size limit,
+    and when it is passed the least recently used results are evicted. A result evicted from memory can still be
+    found on disk.
+    '''
+
+    def __init__(self, directory=None, maxEntries=256, maxBytes=256 * 2 ** 20, maxDiskBytes=4 * 2 ** 30):
+        '''
+        :param directory: where the on-disk tier is kept (created if needed). None keeps results in memory only
+        :param maxEntries: most results kept in memory
+        :param maxBytes: most bytes of arrays kept in memory
+        :param maxDiskBytes: most bytes of files kept in directory
+        '''
+        self.directory = directory
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.maxDiskBytes = maxDiskBytes
+        # key -> (results, size), least recently used first
+        self._memory = OrderedDict()
+        self._memoryBytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        # how many lookups were found in memory, found on disk or missed
+        self.memoryHits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _remember(self, key, results):
+        '''
+        Puts results in the memory tier as the most recently used, evicting the least recently used ones if needed.
+        '''
+        if key in self._memory:
+            self._memoryBytes -= self._memory.pop(key)[1]
+        size = resultSize(results)
+        self._memory[key] = (results, size)
+        self._memoryBytes += size
+        while len(self._memory) > self.maxEntries or (self._memoryBytes > self.maxBytes and len(self._memory) > 1):
+            self._memoryBytes -= self._memory.popitem(last=False)[1][1]
+
+    def get(self, key):
+        '''
+        :return: the results kept under key, or None if there are none
+        '''
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.memoryHits += 1
+            return self._memory[key][0]
+
+        if self.directory is not None and os.path.exists(self._path(key)):
+            with np.load(self._path(key)) as file:
+                results = {name: file[name] for name in file.files}
+            # the file's modification time is when it was last used, for evicting from disk
+            os.utime(self._path(key))
+            self._remember(key, results)
+            self.diskHits += 1
+            return results
+
+        self.misses += 1
+        return None
+
+    def put(self, key, results):
+        '''
+        :param key: key from hashKey
+        :param results: map from names to arrays (or numbers)
+        :return: results with every value as an array, as they are kept
+        '''
+        results = {name: np.asarray(value) for name, value in results.items()}
+        self._remember(key, results)
+        if self.directory is not None:
+            temporary = self._path(key) + ".tmp"
+            with open(temporary, "wb") as file:
+                np.savez(file, **results)
+            os.replace(temporary, self._path(key))
+            self._evictDisk()
+        return results
+
+    def fetch(self, key, compute):
+        '''
+        :param key: key from hashKey
+        :param compute: function with no arguments that works out the results, only called if they aren't cached
+        :return: the results kept under key, computed and kept first if needed
+        '''
+        results = self.get(key)
+        if results is None:
+            # returned as put converted them, since the limits may already have evicted them again
+            results = self.put(key, compute())
+        return results
+
+    def _evictDisk(self):
+        '''
+        Deletes the least recently used files until the directory is within maxDiskBytes.
+        '''
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.maxDiskBytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def clear(self):
+        '''
+        Removes every result, from memory and from disk.
+        '''
+        self._memory.clear()
+        self._memoryBytes = 0
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(self.directory, name))
+
+    def __len__(self):
+        return len(self._memory)
@@ -0,0 +1,228 @@
+import glob
+import json
+import os
+
+import numpy as np
+
+from output import TextOutput
+from payoffs import SAMPLE_PAYOFF
+from rounds import IncrementalEvaluator, playSequentialRound, runReplicates, SAMPLE_WEIGHTS, SAMPLE_BIAS
+from stores import relationshipMatrix
+
+# file names inside a run's directory
+CHECKPOINT_FILE = "checkpoint.npz"
+CHUNK_DIGITS = 12
+
+def _replace(path, save):
+    '''
+    Writes a file through save(temporary path) and then moves it into place, so an interrupted write never leaves
+    a half-written file at path.
+    '''
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        save(file)
+    os.replace(temporary, path)
+
+class ResultsWriter:
+    '''
+    Appends rows of results to a directory as columns of .npy chunks. Every column (cooperation, decisions,
+    reputations, ...) is its own series of files named column-<first row>.npy, so one column can be read back
+    (memory-mapped, see resultChunks and loadResults) without touching the others.
+
+    Rows are kept in memory until flush, which writes them as one chunk per column.
+    '''
+
+    def __init__(self, directory):
+        '''
+        :param directory: where the chunks are written (created if needed)
+        '''
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.rows = 0
+        self._pending = {}
+        self._pendingRows = 0
+
+    def append(self, columns):
+        '''
+        :param columns: map from column name to the value (number or array) of one row
+        '''
+        for column, value in columns.items():
+            self._pending.setdefault(column, []).append(value)
+        self._pendingRows += 1
+
+    def extend(self, columns):
+        '''
+        :param columns: map from column name to an array of rows (all of the same length)
+        '''
+        for column, values in columns.items():
+            self._pending.setdefault(column, []).extend(values)
+        self._pendingRows += len(next(iter(columns.values())))
+
+    def flush(self):
+        for column, values in self._pending.items():
+            path = os.path.join(self.directory, f"{column}-{self.rows:0{CHUNK_DIGITS}d}.npy")
+            _replace(path, lambda file: np.save(file, np.array(values)))
+        self.rows += self._pendingRows
+        self._pending = {}
+        self._pendingRows = 0
+
+    def truncate(self, rows):
+        '''
+        Deletes every chunk starting at or after rows (written after the checkpoint being resumed from), and appends
+        from there.
+        '''
+        for path in glob.glob(os.path.join(self.directory, "*-" + "[0-9]" * CHUNK_DIGITS + ".npy")):
+            if int(path[-4 - CHUNK_DIGITS:-4]) >= rows:
+                os.remove(path)
+        self.rows = rows
+        self._pending = {}
+        self._pendingRows = 0
+
+def resultChunks(directory, column, mmap=True):
+    '''
+    :param directory: directory written by a ResultsWriter
+    :param column: name of the column
+    :param mmap: if True, chunks are memory-mapped, so only the parts that are used are read from disk
+    :return: list of (first row, array) for every chunk of the column, in order
+    '''
+    paths = glob.glob(os.path.join(directory, f"{column}-" + "[0-9]" * CHUNK_DIGITS + ".npy"))
+    return [(int(path[-4 - CHUNK_DIGITS:-4]), np.load(path, mmap_mode="r" if mmap else None)) for path in sorted(paths)]
+
+def loadResults(directory, column):
+    '''
+    :return: the whole column as one array (read into memory), see resultChunks
+    '''
+    chunks = [chunk for _, chunk in resultChunks(directory, column, mmap=False)]
+    return np.concatenate(chunks) if chunks else np.array([])
+
+def saveCheckpoint(path, evaluator, roundNum, settings, rng=None):
+    '''
+    :param path: .npz file to write (replaced in one step, so an interrupted save keeps the previous checkpoint)
+    :param evaluator: IncrementalEvaluator of the run, its reputations, relationships and sums are saved
+    :param roundNum: number of rounds played so far
+    :param settings: map of the run's settings (numbers and lists), checked again when resuming
+    :param rng: numpy random Generator used by the run, if any, whose state is saved
+    '''
+    arrays = dict(evaluator.getState())
+    arrays["relationships"] = relationshipMatrix(evaluator.relationships)
+    arrays["roundNum"] = roundNum
+    arrays["settings"] = json.dumps(settings)
+    arrays["rngState"] = json.dumps(rng.bit_generator.state if rng is not None else None)
+    _replace(path, lambda file: np.savez(file, **arrays))
+
+def loadCheckpoint(path):
+    '''
+    :param path: .npz file from saveCheckpoint
+    :return: map of everything saved: the evaluator's state (see IncrementalEvaluator.getState), relationships,
+    roundNum, settings and rngState (None if no Generator was saved)
+    '''
+    with np.load(path) as checkpoint:
+        state = {key: checkpoint[key] for key in checkpoint.files}
+    state["roundNum"] = int(state["roundNum"])
+    state["settings"] = json.loads(str(state["settings"]))
+    state["rngState"] = json.loads(str(state["rngState"]))
+    return state
+
+def runCheckpointed(reputations, relationships, numRounds, directory, checkpointEvery=1000, learningRate=0.05,
+                    weights=SAMPLE_WEIGHTS, bias=SAMPLE_BIAS, mech=False, bonus=50, output=None, payoff=None,
+                    rng=None, recordReputations=False):
+    '''
+    :param reputations: map (or array) of starting reputations, not used when resuming
+    :param relationships: map, 2D array or store of relationships, not used when resuming
+    :param numRounds: total number of rounds the run should reach
+    :param directory: where the checkpoint and the results are kept. If it already has a checkpoint, the run
+    resumes from it
+    :param checkpointEvery: number of rounds between checkpoints
+    :param learningRate: how much every other nation's reputation changes after a nation moves
+    :param weights: weights for the probability function (SampleSimulation's by default)
+    :param bias: constant added inside the probability function (SampleSimulation's by default)
+    :param mech: if True, cooperating uses the global support mechanism
+    :param bonus: extra util points for cooperating when mech is set
+    :param output: where to report each round (see output.py), printed as text by default
+    :param payoff: PayoffModel for the utilities (see payoffs.py), SampleSimulation's constants (SAMPLE_PAYOFF) by
+    default like runMultipleRounds. It is not saved, so pass the same one when resuming
+    :param rng: numpy random Generator whose state is saved with every checkpoint and restored when resuming,
+    for callers that keep drawing from it
+    :param recordReputations: if True, every round's reputations are kept as a column too (n numbers per round)
+    :return: the final reputations (array) and the number of rounds played in total
+
+    Plays runMultipleRounds, but every checkpointEvery rounds the whole state (reputations, relationships, every
+    nation's sums, the random generator and the round number) is saved to directory, and the rounds since the last
+    checkpoint are appended to the results (see ResultsWriter): the cooperation percentage ("cooperation") and every
+    nation's choice ("decisions", True for cooperate) of every round. An interrupted run started again with the same
+    arguments picks up at its last checkpoint and gives exactly the same results as one that was never stopped.
+    '''
+    output = output if output is not None else TextOutput()
+    payoff = payoff if payoff is not None else SAMPLE_PAYOFF
+    checkpointPath = os.path.join(directory, CHECKPOINT_FILE)
+    settings = {"learningRate": float(learningRate), "weights": [float(w) for w in weights], "bias": float(bias),
+                "mech": bool(mech), "bonus": float(bonus)}
+    writer = ResultsWriter(directory)
+
+    if os.path.exists(checkpointPath):
+        checkpoint = loadCheckpoint(checkpointPath)
+        if checkpoint["settings"] != settings:
+            raise ValueError(f"The checkpoint in {directory} was made with different settings: {checkpoint['settings']}")
+        evaluator = IncrementalEvaluator(checkpoint["reputations"], checkpoint["relationships"], weights, bias, mech,
+                                         bonus, payoff=payoff)
+        evaluator.setState(checkpoint)
+        if rng is not None and checkpoint["rngState"] is not None:
+            rng.bit_generator.state = checkpoint["rngState"]
+        roundNum = checkpoint["roundNum"]
+        writer.truncate(roundNum)
+    else:
+        evaluator = IncrementalEvaluator(reputations, relationships, weights, bias, mech, bonus, payoff=payoff)
+        roundNum = 0
+        writer.truncate(0)
+
+    while roundNum < numRounds:
+        cooperates = playSequentialRound(evaluator, learningRate, output, roundNum + 1)
+        roundNum += 1
+        row = {"cooperation": int(np.count_nonzero(cooperates)) / evaluator.n * 100, "decisions": cooperates}
+        if recordReputations:
+            row["reputations"] = evaluator.reputations.copy()
+        writer.append(row)
+
+        if roundNum % checkpointEvery == 0 or roundNum == numRounds:
+            # results first: a crash between the two leaves chunks past the checkpoint, which resuming deletes
+            writer.flush()
+            output.flush()
+            saveCheckpoint(checkpointPath, evaluator, roundNum, settings, rng)
+
+    output.flush()
+    return evaluator.reputations, roundNum
+
+def runReplicatesToFile(n, seeds, numRounds, directory, replicatesPerChunk=1024, reputationRange=(0, 0.3),
+                        relationshipRange=(-0.5, 0.2), **kwargs):
+    '''
+    :param n: number of players / nations
+    :param seeds: one random seed per replicate
+    :param numRounds: number of rounds to simulate
+    :param directory: where the results are written. Chunks already there are kept, so an interrupted run started
+    again with the same arguments carries on with the next chunk
+    :param replicatesPerChunk: number of replicates run at once (see runBatchRounds) and written per chunk
+    :param reputationRange: (lower, upper) range for the random reputations
+    :param relationshipRange: (lower, upper) range for the random relationships
+    :param kwargs: passed on to runBatchRounds (learningRate, weights, bias, mech, bonus, payoff)
+    :return: the number of replicates in directory
+
+    Runs runReplicates a chunk of seeds at a time and writes each chunk's results as columns (see ResultsWriter):
+    "seeds", "history" (cooperation percentage of every round, one row per replicate) and "reputations" (final
+    reputations), so a million replicates never have to be in memory at once.
+    '''
+    writer = ResultsWriter(directory)
+    seeds = list(seeds)
+    done = {start for start, _ in resultChunks(directory, "history")}
+
+    for start in range(0, len(seeds), replicatesPerChunk):
+        writer.rows = start
+        if start in done:
+            continue
+        chunkSeeds = seeds[start:start + replicatesPerChunk]
+        finalReputations, history = runReplicates(n, chunkSeeds, numRounds, reputationRange, relationshipRange,
+                                                  **kwargs)
+        # history last, since its chunk is what marks this chunk as done
+        writer.extend({"seeds": np.array(chunkSeeds), "reputations": finalReputations, "history": history})
+        writer.flush()
+
+    return len(seeds)
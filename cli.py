@@ -0,0 +1,204 @@
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import sys
+
+from output import makeOutput, MODES, ROUNDS, DECISIONS, DETAILS
+from payoffs import PAYOFFS
+from rounds import runMultipleRounds
+from simulationv2 import PRECISIONS
+from sweep import DEFAULT_SCENARIO, PARTS, makeSimulation, parseRange
+
+# commands that hand their arguments to another module's main, imported only when the command is used
+DELEGATED = {"sweep": "sweep", "benchmark": "benchmarks"}
+# detail levels by name
+DETAIL_LEVELS = {"rounds": ROUNDS, "decisions": DECISIONS, "details": DETAILS}
+
+def plotCooperationHistory(history, path, title="Cooperation Over Time"):
+    '''
+    :param history: percentage of nations cooperating in each round
+    :param path: image file to write (the format comes from its extension, e.g. .png or .svg)
+    :param title: title of the plot
+
+    matplotlib is imported here, the first time a plot is made, with the Agg backend so no display is needed.
+    '''
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    figure, axes = plt.subplots()
+    axes.plot(range(1, len(history) + 1), history)
+    axes.set_xlabel("Round")
+    axes.set_ylabel("Percentage of Cooperation")
+    axes.set_title(title)
+    figure.savefig(path)
+    plt.close(figure)
+
+def loadScenarios(path):
+    '''
+    :param path: JSON file with a list of scenarios, or a map from names to scenarios. A scenario has the keys of
+    DEFAULT_SCENARIO, and can also have a "name" and a "preset" (one of PARTS) whose settings it starts from
+    :return: list of scenarios, each with a name
+    '''
+    with open(path) as file:
+        scenarios = json.load(file)
+    if isinstance(scenarios, dict):
+        scenarios = [dict(scenario, name=name) for name, scenario in scenarios.items()]
+    return [dict(scenario, name=scenario.get("name", f"scenario{i + 1}")) for i, scenario in enumerate(scenarios)]
+
+def expandPreset(scenario):
+    '''
+    :return: the scenario with its preset's settings filled in (its own settings win)
+    '''
+    scenario = dict(scenario)
+    preset = scenario.pop("preset", None)
+    if preset is None:
+        return scenario
+    if preset not in PARTS:
+        raise ValueError(f"Unknown preset {preset!r}, expected one of {sorted(PARTS)}")
+    return dict(PARTS[preset], **scenario)
+
+def buildScenarios(args):
+    '''
+    :param args: parsed arguments of the run command
+    :return: list of scenarios (with names) from the scenario file and the presets, with the settings given as flags
+    on top, and one copy per seed when seeds are given
+    '''
+    scenarios = loadScenarios(args.scenarios) if args.scenarios else []
+    for preset in args.preset or []:
+        names = sorted(PARTS) if preset == "parts" else [preset]
+        scenarios.extend({"name": name, "preset": name} for name in names)
+    if not scenarios:
+        scenarios = [{"name": "scenario"}]
+
+    overrides = {"n": args.n, "rounds": args.rounds, "reputations": args.reputations,
+                 "relationships": args.relationships, "bonus": args.bonus, "payoff": args.payoff,
+                 "precision": args.precision, "logSpace": args.logSpace or None}
+    overrides = {key: value for key, value in overrides.items() if value is not None}
+    scenarios = [dict(expandPreset(scenario), **overrides) for scenario in scenarios]
+
+    if args.seeds:
+        scenarios = [dict(scenario, seed=seed, name=f"{scenario['name']}-seed{seed}" if len(args.seeds) > 1
+                          else scenario["name"]) for scenario in scenarios for seed in args.seeds]
+    return scenarios
+
+def runScenarios(scenarios, output, plotDirectory=None):
+    '''
+    :param scenarios: list of scenarios with names (see buildScenarios)
+    :param output: where to report what happens (see output.py)
+    :param plotDirectory: if given, the cooperation history of every scenario with rounds is plotted to
+    <name>.png in it
+    :return: list of (name, cooperates, history): every nation's choice when each decides once, and the cooperation
+    percentage of every round (empty if the scenario has no rounds)
+
+    Every scenario plays one round where each nation decides once (like the Parts of simulationv2.py), and then its
+    rounds, if it has any (see runMultipleRounds).
+    '''
+    results = []
+    for scenario in scenarios:
+        name = scenario["name"]
+        settings = dict(DEFAULT_SCENARIO, **{key: value for key, value in scenario.items() if key != "name"})
+        if output.enabled(ROUNDS):
+            output.write("scenario", dict(settings, name=name))
+
+        simulation = makeSimulation(settings)
+        mech = settings["bonus"] != 0
+        cooperates = simulation.playRound(mech, output)
+        if output.enabled(ROUNDS):
+            output.write("decided", {"name": name, "cooperationRate": float(cooperates.mean() * 100)})
+
+        history = []
+        if settings["rounds"] > 0:
+            _, history = runMultipleRounds(simulation.reputations, simulation.relationships, settings["rounds"],
+                                           weights=simulation.weights, bias=simulation.bias, mech=mech,
+                                           bonus=simulation.bonus, output=output, payoff=simulation.payoff)
+            if plotDirectory is not None:
+                os.makedirs(plotDirectory, exist_ok=True)
+                plotCooperationHistory(history, os.path.join(plotDirectory, f"{name}.png"),
+                                       f"Cooperation Over Time: {name}")
+        results.append((name, cooperates, history))
+    output.flush()
+    return results
+
+def runV1(players, trials, seed, detailPath=None):
+    '''
+    Compares Simulation V1's greedy and random approaches (see simulationV1.compareApproaches) and prints the result.
+    :param detailPath: if given, the per player messages of the greedy approach and every random trial are streamed
+    to this file (one trial after the other, see simulationV1.randomTotals)
+    '''
+    import numpy as np
+    import simulationV1
+
+    # the trials are drawn once, so the detail file shows the same trials the comparison is made of (even without a
+    # seed)
+    rng = np.random.default_rng(seed)
+    if detailPath:
+        with open(detailPath, "w") as file:
+            comparison = simulationV1.compareApproaches(players, trials, rng, file)
+    else:
+        comparison = simulationV1.compareApproaches(players, trials, rng)
+    print(f"The total utils for all the players with the greedy approach: {comparison['greedy']}")
+    print(f"With the random approach, over {trials} trials: mean {comparison['randomMean']}, smallest "
+          f"{comparison['randomMin']}, largest {comparison['randomMax']}")
+    print(f"The random approach did better in {comparison['randomBetter'] * 100:.2f}% of the trials")
+
+def makeParser():
+    parser = argparse.ArgumentParser(description="Run the simulations without any prompts. Other commands: "
+                                                 + ", ".join(f"'{command}' (see {module}.py)"
+                                                             for command, module in DELEGATED.items()))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="play scenarios from presets, a scenario file or flags")
+    run.add_argument("--scenarios", help="JSON file with a list of scenarios (see DEFAULT_SCENARIO in sweep.py), or "
+                                         "a map from names to scenarios. A scenario can start from a \"preset\"")
+    run.add_argument("--preset", nargs="+", choices=sorted(PARTS) + ["parts"],
+                     help="the Parts of simulationv2.py to run ('parts' runs all four)")
+    run.add_argument("--n", type=int, help="number of nations")
+    run.add_argument("--rounds", type=int, help="number of rounds to play after the first decision")
+    run.add_argument("--reputations", type=parseRange, help="reputation range as lower,upper")
+    run.add_argument("--relationships", type=parseRange, help="relationship range as lower,upper")
+    run.add_argument("--bonus", type=float, help="global support bonus (0 for none)")
+    run.add_argument("--seeds", type=int, nargs="+", help="random seeds, every scenario is run once per seed")
+    run.add_argument("--payoff", choices=sorted(PAYOFFS), help="payoff model")
+    run.add_argument("--precision", choices=sorted(PRECISIONS), help="number type of the all-nations pass")
+    run.add_argument("--log-space", dest="logSpace", action="store_true", help="work with logs of the utilities")
+    run.add_argument("--mode", choices=MODES, default="text", help="how to report (text, JSON lines or nothing)")
+    run.add_argument("--detail", choices=sorted(DETAIL_LEVELS), default="decisions", help="how much to report")
+    run.add_argument("--output", help="file to report to (standard output by default)")
+    run.add_argument("--plot", help="directory to save a plot of each scenario's rounds to")
+
+    v1 = commands.add_parser("v1", help="compare Simulation V1's greedy and random approaches")
+    v1.add_argument("--players", type=int, default=10, help="number of players")
+    v1.add_argument("--trials", type=int, default=1000, help="number of random trials")
+    v1.add_argument("--seed", type=int, help="random seed")
+    v1.add_argument("--detail", help="file to stream every player's choice and utility to. With several trials, "
+                                     "lines start with 'Trial <t>:' and the trials come one after the other")
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in DELEGATED:
+        return importlib.import_module(DELEGATED[argv[0]]).main(argv[1:])
+
+    parser = makeParser()
+    args = parser.parse_args(argv)
+    if args.command == "v1":
+        runV1(args.players, args.trials, args.seed, args.detail)
+        return 0
+
+    if args.plot and importlib.util.find_spec("matplotlib") is None:
+        parser.error("--plot needs matplotlib (pip install matplotlib)")
+
+    file = open(args.output, "w") if args.output else None
+    try:
+        output = makeOutput(args.mode, file, DETAIL_LEVELS[args.detail])
+        runScenarios(buildScenarios(args), output, args.plot)
+    finally:
+        if file is not None:
+            file.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import json
+import sys
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+# the context manager every phase gets while instruments are off
+_NO_PHASE = nullcontext()
+
+class Instruments:
+    '''
+    Counters and phase timers for the hot paths (probabilities built, subsets visited, utilities evaluated, reputation
+    updates, output...). This base class is what runs while instrumentation is off: it records nothing.
+
+    The simulation reports to the current instruments (see current, enable and disable). Like an Output, callers check
+    enabled before counting, and a phase is a shared do-nothing context manager, so instrumentation that is off costs
+    a context variable lookup per call site:
+
+        record = instruments.current()
+        if record.enabled:
+            record.count("subsets", len(combinations))
+        with record.phase("decide", nation=i, roundNum=roundNum):
+            ...
+    '''
+    enabled = False
+
+    def count(self, name, amount=1):
+        pass
+
+    def phase(self, name, nation=None, roundNum=None):
+        return _NO_PHASE
+
+class _Phase:
+    '''
+    Times one phase for a Recorder.
+    '''
+
+    def __init__(self, recorder, name, nation, roundNum):
+        self.recorder = recorder
+        self.name = name
+        self.nation = nation
+        self.roundNum = roundNum
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.addPhase(self.name, self.start, time.perf_counter() - self.start, self.nation, self.roundNum)
+
+class Recorder(Instruments):
+    '''
+    Instruments that record: counters by name, and for every phase its number of calls, total and longest time. Every
+    traceEvery-th phase is also kept as an event (with its nation and round, when given) for the trace.
+
+    Phases can be nested (a nation's "decide" contains its "probabilities"), so the totals of different phases can
+    overlap.
+    '''
+    enabled = True
+
+    def __init__(self, traceEvery=1, maxEvents=1000000):
+        '''
+        :param traceEvery: keep one phase out of this many in the trace (0 keeps none), for sampling long runs
+        :param maxEvents: most events kept in the trace, the ones after that are only counted in the totals
+        '''
+        self.traceEvery = traceEvery
+        self.maxEvents = maxEvents
+        self.counters = {}
+        # name -> [calls, total seconds, longest seconds]
+        self.phases = {}
+        self.events = []
+        self.started = time.perf_counter()
+        self._phaseCount = 0
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def phase(self, name, nation=None, roundNum=None):
+        return _Phase(self, name, nation, roundNum)
+
+    def addPhase(self, name, start, seconds, nation=None, roundNum=None):
+        totals = self.phases.get(name)
+        if totals is None:
+            self.phases[name] = [1, seconds, seconds]
+        else:
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+
+        self._phaseCount += 1
+        if self.traceEvery and self._phaseCount % self.traceEvery == 0 and len(self.events) < self.maxEvents:
+            event = {"phase": name, "start": start - self.started, "seconds": seconds}
+            if nation is not None:
+                event["nation"] = int(nation)
+            if roundNum is not None:
+                event["round"] = int(roundNum)
+            self.events.append(event)
+
+    def summary(self):
+        '''
+        :return: dict with the counters, and the calls, total, mean and longest seconds of every phase
+        '''
+        phases = {name: {"calls": calls, "seconds": total, "mean": total / calls, "longest": longest}
+                  for name, (calls, total, longest) in self.phases.items()}
+        return {"counters": dict(self.counters), "phases": phases}
+
+    def totalsBy(self, name, key):
+        '''
+        :param name: a phase
+        :param key: "nation" or "round"
+        :return: map from nation (or round) to the total seconds of that phase, from the traced events
+        '''
+        totals = {}
+        for event in self.events:
+            if event["phase"] == name and key in event:
+                totals[event[key]] = totals.get(event[key], 0) + event["seconds"]
+        return totals
+
+    def report(self, file=None):
+        '''
+        Writes a summary table of the phases (slowest first) and the counters.
+        :param file: open text file to write to (standard output by default)
+        '''
+        file = file or sys.stdout
+        lines = [f"{'phase':20} {'calls':>10} {'total ms':>12} {'mean ms':>10} {'longest ms':>11}"]
+        for name, (calls, total, longest) in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:20} {calls:10d} {total * 1000:12.3f} {total / calls * 1000:10.4f} {longest * 1000:11.4f}")
+        lines.append("")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:28} {value:14d}")
+        file.write("\n".join(lines) + "\n")
+
+    def writeTrace(self, file):
+        '''
+        Writes the trace as JSON lines: one {"event": "phase", ...} per traced phase (start and seconds are relative
+        to when the recorder was created), then one {"event": "summary", ...} with the counters and totals.
+        :param file: open text file to write to
+        '''
+        file.write("".join(json.dumps({"event": "phase", **event}) + "\n" for event in self.events))
+        file.write(json.dumps({"event": "summary", **self.summary()}) + "\n")
+
+# the instruments everything reports to. Each thread (and asyncio task) has its own, so a recorder only sees the runs
+# of the thread that enabled it; new threads start with instrumentation off
+_current = ContextVar("instruments", default=Instruments())
+
+def current():
+    '''
+    :return: the instruments the simulation reports to in this thread
+    '''
+    return _current.get()
+
+def enable(traceEvery=1, maxEvents=1000000):
+    '''
+    Starts recording in this thread, see Recorder.
+    :return: the Recorder, to read the report and trace from
+    '''
+    recorder = Recorder(traceEvery, maxEvents)
+    _current.set(recorder)
+    return recorder
+
+def disable():
+    '''
+    Stops recording in this thread.
+    :return: the Recorder that was recording, if any
+    '''
+    recorder = _current.get()
+    _current.set(Instruments())
+    return recorder
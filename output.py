@@ -0,0 +1,161 @@
+import json
+import math
+import sys
+
+import instruments
+
+# how much detail an event carries. An output only receives events at or below its own detail level
+ROUNDS = 0  # one event per round (cooperation rate, reputations)
+DECISIONS = 1  # one event per nation per turn (expected utilities and the choice)
+DETAILS = 2  # everything, including the probabilities each nation considers
+
+def _percent(probability, logProbability=None):
+    '''
+    :param probability: a probability
+    :param logProbability: its log, if known (it stays meaningful after the probability itself underflows to 0)
+    :return: the probability as a percentage rounded to two decimals, or in scientific notation when that rounding
+    would show a probability that isn't 0 as 0
+    '''
+    percent = round(probability * 100, 2)
+    if percent != 0 or logProbability is None or logProbability == -math.inf:
+        return percent
+    log10 = (logProbability / math.log(10)) + 2
+    exponent = math.floor(log10)
+    return f"{10 ** (log10 - exponent):.2f}e{exponent}"
+
+def _consider(fields):
+    nation, choice = fields["nation"] + 1, fields["choice"]
+    probAllCooperate = _percent(fields["probAllCooperate"], fields.get("logProbAllCooperate"))
+    probAllDefect = _percent(fields["probAllDefect"], fields.get("logProbAllDefect"))
+    return [f"Now nation {nation} is considering what all other nations will do when nation {nation} {choice}",
+            f"If nation {nation} {choice}, the total probability of all other nations cooperating is {probAllCooperate}%, and",
+            f"the total probability of all other nations defecting is {probAllDefect}%"]
+
+def _roundEnd(fields):
+    lines = ["", f"End of round {fields['round']}", f"{fields['cooperationRate']}% of nations cooperated"]
+    if "reputations" in fields:
+        lines.append(f"Updated Reputations: {dict(enumerate(fields['reputations']))}")
+    lines.append("===================================")
+    return lines
+
+# how TextOutput writes each kind of event, as a function from the event's fields to lines of text
+TEXT_TEMPLATES = {
+    "round": lambda fields: ["", f"Round {fields['round']}"],
+    "turn": lambda fields: [f"Nation {fields['nation'] + 1}'s turn..."],
+    "consider": _consider,
+    "utilities": lambda fields: [f"Nation {fields['nation'] + 1}'s expected utility for cooperating is {fields['cooperating']} ",
+                                 f"Nation {fields['nation'] + 1}'s expected utility for defecting is {fields['defecting']} "],
+    "decision": lambda fields: [f"{fields['nation'] + 1} chooses to {fields['action']}", "", ""],
+    "roundEnd": _roundEnd,
+    "scenario": lambda fields: ["", f"Scenario {fields['name']}: {fields['n']} nations, reputations {fields['reputations']}, "
+                                    f"relationships {fields['relationships']}, bonus {fields['bonus']}, seed {fields['seed']}"],
+    "decided": lambda fields: [f"{fields['cooperationRate']}% of nations chose to cooperate"],
+}
+
+class Output:
+    '''
+    Where the simulation reports what happens. This base class is the silent output: it drops everything.
+
+    Callers check enabled(level) before building an event, so a silent output (or a detail level below the event's)
+    costs one comparison and no string formatting:
+
+        if output.enabled(DECISIONS):
+            output.write("decision", {"nation": i, "action": action})
+
+    Outputs buffer what they are given; call flush (or close, or use them in a with block) to make sure everything
+    is written.
+    '''
+    detail = -1
+
+    def enabled(self, level):
+        return level <= self.detail
+
+    def write(self, kind, fields):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class TextOutput(Output):
+    '''
+    Human readable text, the same narrative the simulation has always printed (see TEXT_TEMPLATES).
+    '''
+
+    def __init__(self, file=None, detail=DETAILS, bufferLines=1000):
+        '''
+        :param file: open text file to write to (standard output by default)
+        :param detail: ROUNDS, DECISIONS or DETAILS
+        :param bufferLines: number of lines kept before they are written
+        '''
+        self.file = file
+        self.detail = detail
+        self.bufferLines = bufferLines
+        self._lines = []
+
+    def write(self, kind, fields):
+        with instruments.current().phase("output"):
+            self._lines.extend(TEXT_TEMPLATES[kind](fields))
+        if len(self._lines) >= self.bufferLines:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            with instruments.current().phase("output"):
+                file = self.file or sys.stdout
+                file.write("\n".join(self._lines) + "\n")
+                self._lines = []
+
+class EventOutput(Output):
+    '''
+    A compact structured stream: one JSON object per line, with the kind of event in "event" and its fields
+    (nation numbers start at 0). Events are encoded and written in batches.
+    '''
+
+    def __init__(self, file, detail=DECISIONS, batchSize=1000):
+        '''
+        :param file: open text file to write to
+        :param detail: ROUNDS, DECISIONS or DETAILS
+        :param batchSize: number of events kept before they are written
+        '''
+        self.file = file
+        self.detail = detail
+        self.batchSize = batchSize
+        self._events = []
+
+    def write(self, kind, fields):
+        self._events.append((kind, fields))
+        if len(self._events) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if self._events:
+            with instruments.current().phase("output"):
+                self.file.write("".join(json.dumps({"event": kind, **fields}) + "\n" for kind, fields in self._events))
+                self._events = []
+
+# output modes by name, see makeOutput
+MODES = ("silent", "text", "jsonl")
+
+def makeOutput(mode="text", file=None, detail=DETAILS):
+    '''
+    :param mode: "silent", "text" or "jsonl"
+    :param file: open text file to write to (standard output by default)
+    :param detail: ROUNDS, DECISIONS or DETAILS
+    :return: an Output
+    '''
+    if mode == "silent":
+        return Output()
+    if mode == "text":
+        return TextOutput(file, detail)
+    if mode == "jsonl":
+        return EventOutput(file or sys.stdout, detail)
+    raise ValueError(f"Unknown output mode {mode!r}, expected one of {MODES}")
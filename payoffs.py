@@ -0,0 +1,119 @@
+import math
+import numpy as np
+
+import instruments
+
+class PayoffModel:
+    '''
+    How many util points a nation gets for cooperating and for defecting, given the number of players defecting.
+
+    Subclasses define cooperating and defecting. The engines never call them while summing: a model is compiled once
+    per scenario into two lookup tables (see compile), and entry k of a table is the utility when k players defect.
+    '''
+
+    def cooperating(self, numPlayersDefecting):
+        raise NotImplementedError
+
+    def defecting(self, numPlayersDefecting):
+        raise NotImplementedError
+
+    def compile(self, n):
+        '''
+        :param n: number of players / nations
+        :return: two arrays of length n + 1, the utility for cooperating and for defecting when 0 to n players defect
+        '''
+        counts = range(n + 1)
+        record = instruments.current()
+        if record.enabled:
+            record.count("utilityEvaluations", 2 * (n + 1))
+        return (np.array([self.cooperating(k) for k in counts], dtype=np.float64),
+                np.array([self.defecting(k) for k in counts], dtype=np.float64))
+
+class LogPayoff(PayoffModel):
+    '''
+    The utility functions from the readMe: a base utility minus a scalar times log(1 + number of players defecting).
+    The defaults are the ones in simulationv2.py (cooperatingUtility and defectingUtility).
+    '''
+
+    def __init__(self, cooperatingUtility=15, cooperatingScalar=2, defectingUtility=30, defectingScalar=3):
+        '''
+        :param cooperatingUtility: A constant that represents the base utility for cooperating
+        :param cooperatingScalar: A constant that represents the base cost for cooperating
+        :param defectingUtility: A constant that represents the base utility for defecting
+        :param defectingScalar: A constant that represents the base cost for defecting
+        '''
+        self.cooperatingUtility = cooperatingUtility
+        self.cooperatingScalar = cooperatingScalar
+        self.defectingUtility = defectingUtility
+        self.defectingScalar = defectingScalar
+
+    def cooperating(self, numPlayersDefecting):
+        return self.cooperatingUtility - (self.cooperatingScalar * math.log(1 + numPlayersDefecting))
+
+    def defecting(self, numPlayersDefecting):
+        return self.defectingUtility - (self.defectingScalar * math.log(1 + numPlayersDefecting))
+
+class LinearPayoff(PayoffModel):
+    '''
+    Simulation V1's utility functions (cooperate and defect in simulationV1.py): a base utility minus a scalar times
+    the number of players defecting.
+    '''
+
+    def __init__(self, cooperatingUtility=8, cooperatingScalar=3, defectingUtility=10, defectingScalar=2):
+        '''
+        :param cooperatingUtility: Base utility for not building arms
+        :param cooperatingScalar: Cost scaling factor for not building arms
+        :param defectingUtility: Base utility for building arms
+        :param defectingScalar: Cost scaling factor for building arms
+        '''
+        self.cooperatingUtility = cooperatingUtility
+        self.cooperatingScalar = cooperatingScalar
+        self.defectingUtility = defectingUtility
+        self.defectingScalar = defectingScalar
+
+    def cooperating(self, numPlayersDefecting):
+        return self.cooperatingUtility - (self.cooperatingScalar * numPlayersDefecting)
+
+    def defecting(self, numPlayersDefecting):
+        return self.defectingUtility - (self.defectingScalar * numPlayersDefecting)
+
+class BonusPayoff(PayoffModel):
+    '''
+    Another model with a global support mechanism: cooperating gives bonus extra util points
+    (like cooperatingUtilityMech).
+    '''
+
+    def __init__(self, model, bonus=50):
+        '''
+        :param model: the PayoffModel without the mechanism
+        :param bonus: extra util points given by the global support mechanism
+        '''
+        self.model = model
+        self.bonus = bonus
+
+    def cooperating(self, numPlayersDefecting):
+        return self.model.cooperating(numPlayersDefecting) + self.bonus
+
+    def defecting(self, numPlayersDefecting):
+        return self.model.defecting(numPlayersDefecting)
+
+    def compile(self, n):
+        cooperating, defecting = self.model.compile(n)
+        return cooperating + self.bonus, defecting
+
+class FunctionPayoff(PayoffModel):
+    '''
+    A model made of any two functions from the number of players defecting to a utility.
+    '''
+
+    def __init__(self, cooperating, defecting):
+        self.cooperating = cooperating
+        self.defecting = defecting
+
+# the readMe's model used by simulationv2.py, SampleSimulation's constants, and Simulation V1's linear model
+DEFAULT_PAYOFF = LogPayoff()
+SAMPLE_PAYOFF = LogPayoff(cooperatingUtility=15, cooperatingScalar=3, defectingUtility=30, defectingScalar=2)
+V1_PAYOFF = LinearPayoff()
+
+# payoff models by name, for scenario files and the command line
+PAYOFFS = {"log": DEFAULT_PAYOFF, "sample": SAMPLE_PAYOFF, "linear": V1_PAYOFF}
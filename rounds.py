@@ -0,0 +1,543 @@
+import hashlib
+
+import numpy as np
+
+import instruments
+from output import TextOutput, ROUNDS, DECISIONS, DETAILS
+from payoffs import DEFAULT_PAYOFF, SAMPLE_PAYOFF, BonusPayoff
+from simulationv2 import (WEIGHTS, BIAS, scaledElementarySymmetric, scaledElementarySymmetricRows, signedGreater,
+                          signedLog, signedScaledSum)
+from stores import (asReputations, asRelationships, setRelationship, getReputationVector,
+                    getRelationshipMatrix)
+
+# probability weights and bias used by SampleSimulation. With payoffs.SAMPLE_PAYOFF they are the default model of the
+# round engines (runMultipleRounds, findEquilibrium, runBatchRounds and checkpoints.runCheckpointed)
+SAMPLE_WEIGHTS = (5, 1, 1)
+SAMPLE_BIAS = -1.1
+# decimals of the reputations compared by findEquilibrium when looking for a state it has already visited
+STATE_DECIMALS = 12
+
+def removeFactor(sums, value):
+    '''
+    :param sums: elementary symmetric sums (see elementarySymmetric) of some values, one of which is value
+    :param value: the value to take out
+    :return: the elementary symmetric sums without value, same length as sums (the last entry is 0)
+
+    This divides the polynomial by (1 + value * x), which takes O(n). Going forward (c[k] = e[k] - value * c[k - 1])
+    loses precision once the sums start shrinking faster than value, so from that point on the division is done
+    backward from the top instead (c[k - 1] = (e[k] - c[k]) / value), which is stable there.
+    The division has to go in order (each sum needs the one next to it), so it runs over plain lists.
+    '''
+    e = sums.tolist()
+    top = len(e) - 1
+    c = [0.0] * len(e)
+    c[0] = e[0]
+
+    # forward until the division stops being stable
+    split = top
+    for k in range(1, top):
+        c[k] = e[k] - value * c[k - 1]
+        if c[k] < value * c[k - 1]:
+            split = k
+            break
+
+    # backward from the top for the rest
+    if split < top:
+        c[top - 1] = e[top] / value
+        for k in range(top - 1, split, -1):
+            c[k - 1] = (e[k] - c[k]) / value
+
+    return np.array(c)
+
+def addFactor(sums, value):
+    '''
+    :param sums: elementary symmetric sums of some values, with a 0 in the last entry to make room for value
+    :param value: the value to add
+    :return: the elementary symmetric sums with value added, in O(n)
+    '''
+    sums[1:] += value * sums[:-1]
+    return sums
+
+class IncrementalEvaluator:
+    '''
+    Keeps every nation's elementary symmetric sums (the count distributions used by
+    getExpectedUtilityCombinationsPolynomial) between calls, so they don't have to be built from zero after every move.
+
+    Each nation remembers the probabilities its sums were built from. When its expected utilities are asked for,
+    only the other nations whose probability changed since then are swapped out: the old factor is removed and the
+    new one is added, O(n) each. If too many changed, or a nation has done too many swaps in a row (removing
+    factors slowly loses precision), its sums are rebuilt from scratch instead. The sums are rescaled as they are built
+    (scaledElementarySymmetric) and each nation keeps its log scale, so they never overflow however large n is.
+
+    Reputations and relationships can be changed with setReputation(s) and setRelationship.
+    '''
+
+    def __init__(self, reputations, relationships, weights=WEIGHTS, bias=BIAS, mech=False, bonus=50, maxChanges=16,
+                 refreshAfter=32, payoff=None):
+        '''
+        :param reputations: map (or array) of reputations, see getReputations
+        :param relationships: map, 2D array or store of relationships, see getRelationships and stores.py (arrays
+        and stores are not copied)
+        :param weights: weights for reputations, relationships and choice in the probability function
+        :param bias: constant added inside the probability function
+        :param mech: if True, cooperating uses the global support mechanism (cooperatingUtilityMech)
+        :param bonus: extra util points for cooperating when mech is set
+        :param maxChanges: the most changed nations a swap is used for. Above it, a nation's sums are rebuilt
+        :param refreshAfter: number of swaps after which a nation's sums are rebuilt to clear rounding errors
+        :param payoff: PayoffModel for the utilities (see payoffs.py), the readMe's log model by default
+        '''
+        self.n = len(reputations)
+        self.reputations = np.array(asReputations(reputations), dtype=np.float64)
+        self.relationships = asRelationships(relationships)
+        self.weights = weights
+        self.bias = bias
+        self.maxChanges = maxChanges
+        self.refreshAfter = refreshAfter
+
+        n = self.n
+        sizes = np.arange(1, n)
+        payoff = payoff if payoff is not None else DEFAULT_PAYOFF
+        cooperatingTable, self._defectingTable = payoff.compile(n)
+        chosenTable = BonusPayoff(payoff, bonus).compile(n)[0] if mech else cooperatingTable
+        # utilities by number of nations defecting in a combination, for cooperating (choice 0) and defecting (choice 1)
+        self._cooperatingUtilities = [chosenTable[n - sizes], cooperatingTable[n - sizes]]
+        self._cooperatingUtilityNone = [chosenTable[0], cooperatingTable[0]]
+        self._defectingUtilities = self._defectingTable[sizes]
+
+        # for each choice: the probabilities each nation's sums were built from (NaN until the first build),
+        # the sums of the probabilities of cooperating and of defecting with their log scales, and the number of swaps
+        # since the last build
+        self._builtFrom = [np.full((n, n), np.nan), np.full((n, n), np.nan)]
+        self._sumsCooperate = [np.zeros((n, n)), np.zeros((n, n))]
+        self._sumsDefect = [np.zeros((n, n)), np.zeros((n, n))]
+        self._scaleCooperate = [np.zeros(n), np.zeros(n)]
+        self._scaleDefect = [np.zeros(n), np.zeros(n)]
+        self._swaps = [np.zeros(n, dtype=int), np.zeros(n, dtype=int)]
+
+        # how many times sums were swapped or rebuilt, useful for checking how much work was saved
+        self.swapCount = 0
+        self.rebuildCount = 0
+
+    def setReputation(self, nation, value):
+        self.reputations[nation] = value
+
+    def setReputations(self, values):
+        self.reputations[:] = values
+
+    def setRelationship(self, a, b, value):
+        # relationships are symmetric
+        setRelationship(self.relationships, a, b, value)
+
+    def getState(self):
+        '''
+        :return: map of arrays with everything the evaluator remembers (reputations and every nation's sums), for
+        checkpoints. Relationships are not included
+        '''
+        state = {"reputations": self.reputations, "swapCount": self.swapCount, "rebuildCount": self.rebuildCount}
+        for choice in (0, 1):
+            state[f"builtFrom{choice}"] = self._builtFrom[choice]
+            state[f"sumsCooperate{choice}"] = self._sumsCooperate[choice]
+            state[f"sumsDefect{choice}"] = self._sumsDefect[choice]
+            state[f"scaleCooperate{choice}"] = self._scaleCooperate[choice]
+            state[f"scaleDefect{choice}"] = self._scaleDefect[choice]
+            state[f"swaps{choice}"] = self._swaps[choice]
+        return state
+
+    def setState(self, state):
+        '''
+        :param state: map from getState. Afterwards the evaluator gives exactly the same numbers as the one it came from
+        '''
+        self.reputations[:] = state["reputations"]
+        self.swapCount = int(state["swapCount"])
+        self.rebuildCount = int(state["rebuildCount"])
+        for choice in (0, 1):
+            self._builtFrom[choice][:] = state[f"builtFrom{choice}"]
+            self._sumsCooperate[choice][:] = state[f"sumsCooperate{choice}"]
+            self._sumsDefect[choice][:] = state[f"sumsDefect{choice}"]
+            # states saved before the sums were rescaled have no scales, which is the same as scales of 0
+            self._scaleCooperate[choice][:] = state.get(f"scaleCooperate{choice}", 0)
+            self._scaleDefect[choice][:] = state.get(f"scaleDefect{choice}", 0)
+            self._swaps[choice][:] = state[f"swaps{choice}"]
+
+    def probabilityRow(self, nation, choice):
+        '''
+        :return: the probability of every nation cooperating when nation makes that choice, the same row as
+        getProbabilityTensor(...)[nation, :, choice]
+        '''
+        w1, w2, w3 = self.weights
+        record = instruments.current()
+        if record.enabled:
+            record.count("probabilityEvaluations", self.n)
+        x = (self.reputations * w1) + (self.relationships[nation] * w2) + (-choice * w3) + self.bias
+        return 1 / (1 + np.exp(-x))
+
+    def _update(self, nation, choice, probCooperate):
+        '''
+        Brings nation's sums for choice up to date with probCooperate.
+        '''
+        builtFrom = self._builtFrom[choice][nation]
+        changed = np.flatnonzero(probCooperate != builtFrom)
+        changed = changed[changed != nation]
+        # nation's own entry is only NaN before its sums are first built
+        firstBuild = np.isnan(builtFrom[nation])
+        if len(changed) == 0 and not firstBuild:
+            return
+
+        swaps = self._swaps[choice][nation] + len(changed)
+        if firstBuild or len(changed) > self.maxChanges or swaps > self.refreshAfter:
+            others = np.arange(self.n) != nation
+            self._sumsCooperate[choice][nation], self._scaleCooperate[choice][nation] = scaledElementarySymmetric(
+                probCooperate[others])
+            self._sumsDefect[choice][nation], self._scaleDefect[choice][nation] = scaledElementarySymmetric(
+                1 - probCooperate[others])
+            self._swaps[choice][nation] = 0
+            self.rebuildCount += 1
+        else:
+            sumsCooperate = self._sumsCooperate[choice][nation]
+            sumsDefect = self._sumsDefect[choice][nation]
+            for j in changed:
+                sumsCooperate = addFactor(removeFactor(sumsCooperate, builtFrom[j]), probCooperate[j])
+                sumsDefect = addFactor(removeFactor(sumsDefect, 1 - builtFrom[j]), 1 - probCooperate[j])
+            self._sumsCooperate[choice][nation] = sumsCooperate
+            self._sumsDefect[choice][nation] = sumsDefect
+            self._swaps[choice][nation] = swaps
+            self.swapCount += len(changed)
+
+        self._builtFrom[choice][nation] = probCooperate
+
+    def _evaluate(self, nation, choice):
+        '''
+        :return: (utility, (sign, log)): nation's expected utility for that choice (see expectedUtility), and its sign
+        and the log of its absolute value (see signedGreater)
+        '''
+        probCooperate = self.probabilityRow(nation, choice)
+        self._update(nation, choice, probCooperate)
+
+        sumsCooperate = self._sumsCooperate[choice][nation]
+        sumsDefect = self._sumsDefect[choice][nation]
+        scaleCooperate = self._scaleCooperate[choice][nation]
+        scaleDefect = self._scaleDefect[choice][nation]
+        others = self.n - 1
+
+        # same sum as getExpectedUtilitiesForChoice, for one nation
+        cooperatingPart = probCooperate[nation] * (sumsCooperate[:others][::-1] @ self._cooperatingUtilities[choice])
+        defectingPart = sumsDefect[1:] @ self._defectingUtilities
+        # the last sums are the products of all of them, the total probability of all other nations cooperating / defecting
+        allDefect = sumsDefect[others] * self._defectingTable[others]
+        allCooperate = sumsCooperate[others] * self._cooperatingUtilityNone[choice]
+
+        if scaleCooperate == 0 and scaleDefect == 0:
+            combinations = round(float(cooperatingPart + defectingPart), 2)
+            res = round(float(allDefect + allCooperate + combinations), 2)
+            return res, signedLog(res)
+
+        # the sums were rescaled, so the parts are added as logs, each on its own scale
+        sign, log = signedScaledSum(np.array([cooperatingPart, defectingPart, allDefect, allCooperate]),
+                                    np.array([scaleCooperate, scaleDefect, scaleDefect, scaleCooperate]))
+        with np.errstate(over="ignore"):
+            return round(float(sign * np.exp(log)), 2), (sign, log)
+
+    def expectedUtility(self, nation, choice):
+        '''
+        :param nation: the nation making the choice
+        :param choice: if nation is cooperating (0) or defecting (1)
+        :return: nation's expected utility for that choice, the same as getExpectedUtilityCooperating (choice 0,
+        or getExpectedUtilityCooperatingMech when mech is set) or getExpectedUtilityDefecting (choice 1). Past
+        roughly a thousand nations it can be beyond the float range and come out as inf, so use decide to compare
+        '''
+        return self._evaluate(nation, choice)[0]
+
+    def expectedUtilities(self, nation):
+        '''
+        :return: nation's expected utility for cooperating and for defecting
+        '''
+        return self.expectedUtility(nation, 0), self.expectedUtility(nation, 1)
+
+    def decide(self, nation):
+        '''
+        :return: (expCooperating, expDefecting, cooperates): nation's expected utilities for cooperating and for
+        defecting, and True if cooperating is the larger one. The utilities are compared as logs (signedGreater),
+        so the choice stays right when they are too large for a float
+        '''
+        cooperating, logCooperating = self._evaluate(nation, 0)
+        defecting, logDefecting = self._evaluate(nation, 1)
+        return cooperating, defecting, bool(signedGreater(logCooperating, logDefecting))
+
+def updateReputations(reputations, actionTaken, thisNation, learningRate=0.05):
+    '''
+    :param reputations: array of reputations, changed in place
+    :param actionTaken: 'cooperate' or 'defect'
+    :param thisNation: the nation that took the action. Every other nation's reputation changes
+    :param learningRate: how much each reputation changes
+    :return: reputations
+
+    Same as calling SampleSimulation's update_reputation for every other nation, as one array operation.
+    Reputations stay between 0 and 1.
+    '''
+    own = reputations[thisNation]
+    change = learningRate if actionTaken == 'cooperate' else -learningRate
+    np.clip(reputations + change, 0, 1, out=reputations)
+    reputations[thisNation] = own
+    return reputations
+
+def playSequentialRound(evaluator, learningRate, output, roundNum):
+    '''
+    :param evaluator: IncrementalEvaluator holding the current reputations, which are updated after every move
+    :param learningRate: how much every other nation's reputation changes after a nation moves
+    :param output: where to report the round (see output.py)
+    :param roundNum: number of the round, for the output (starting at 1)
+    :return: array of length n, True for every nation that chose to cooperate
+
+    One round of runMultipleRounds: every nation in turn picks its best response to the current reputations.
+    '''
+    n = evaluator.n
+    decisions = output.enabled(DECISIONS)
+    if output.enabled(ROUNDS):
+        output.write("round", {"round": roundNum})
+    cooperates = np.zeros(n, dtype=bool)
+    record = instruments.current()
+
+    for i in range(n):
+        with record.phase("decide", nation=i, roundNum=roundNum):
+            expCop, expDef, cooperating = evaluator.decide(i)
+
+        if cooperating:
+            action = 'cooperate'
+            cooperates[i] = True
+        else:
+            action = 'defect'
+
+        if decisions:
+            output.write("utilities", {"nation": i, "cooperating": expCop, "defecting": expDef})
+            output.write("decision", {"nation": i, "action": action})
+
+        with record.phase("reputations", nation=i, roundNum=roundNum):
+            updateReputations(evaluator.reputations, action, i, learningRate)
+
+    if record.enabled:
+        record.count("reputationUpdates", n * (n - 1))
+    if output.enabled(ROUNDS):
+        event = {"round": roundNum, "cooperationRate": int(np.count_nonzero(cooperates)) / n * 100}
+        if output.enabled(DETAILS):
+            event["reputations"] = evaluator.reputations.tolist()
+        output.write("roundEnd", event)
+    return cooperates
+
+def runMultipleRounds(reputations, relationships, numRounds=10, learningRate=0.05, weights=SAMPLE_WEIGHTS,
+                      bias=SAMPLE_BIAS, mech=False, bonus=50, output=None, payoff=None):
+    '''
+    :param reputations: map (or array) of starting reputations
+    :param relationships: map (or 2D array) of relationships
+    :param numRounds: number of rounds to simulate
+    :param learningRate: how much every other nation's reputation changes after a nation moves
+    :param weights: weights for the probability function (SampleSimulation's by default)
+    :param bias: constant added inside the probability function (SampleSimulation's by default)
+    :param mech: if True, cooperating uses the global support mechanism
+    :param bonus: extra util points for cooperating when mech is set
+    :param output: where to report each round (see output.py), printed as text by default
+    :param payoff: PayoffModel for the utilities (see payoffs.py), SampleSimulation's constants (SAMPLE_PAYOFF) by
+    default
+    :return: the final reputations (array) and the percentage of nations cooperating in each round
+
+    Plays the rounds like SampleSimulation's run_multiple_rounds: nations move one at a time, and after each move
+    every other nation's reputation goes up (cooperate) or down (defect). By default the model is SampleSimulation's
+    weights, bias and utility constants, but the expected utilities follow the readMe (the same numbers as
+    Simulation.expectedUtility with those settings), and come from an IncrementalEvaluator so a move only costs the
+    reputations it actually changed. Once reputations reach 0 or 1 they stop changing, and the rounds after that are
+    almost free.
+
+    This does not reproduce SampleSimulation's numbers: its get_expected_utility weighs every combination by the
+    probability of all nations cooperating and adds the defecting utilities unweighted, so its choices differ
+    (with reputations of 0.7 - 1 it defects where this cooperates). Only the round dynamics are the same.
+    '''
+    output = output if output is not None else TextOutput()
+    payoff = payoff if payoff is not None else SAMPLE_PAYOFF
+    evaluator = IncrementalEvaluator(reputations, relationships, weights, bias, mech, bonus, payoff=payoff)
+    cooperationHistory = []
+
+    for roundNum in range(numRounds):
+        with instruments.current().phase("round", roundNum=roundNum + 1):
+            cooperates = playSequentialRound(evaluator, learningRate, output, roundNum + 1)
+        # record cooperation percentage for this round
+        cooperationHistory.append(int(np.count_nonzero(cooperates)) / evaluator.n * 100)
+
+    output.flush()
+    return evaluator.reputations, cooperationHistory
+
+def stateKey(profile, reputations, decimals=STATE_DECIMALS):
+    '''
+    :return: a short hash of the strategy profile and the reputations (rounded to decimals), for spotting a state
+    that was already visited
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.packbits(profile).tobytes())
+    digest.update(np.round(reputations, decimals).tobytes())
+    return digest.digest()
+
+def findEquilibrium(reputations, relationships, maxIterations=100, learningRate=0.05, weights=SAMPLE_WEIGHTS,
+                    bias=SAMPLE_BIAS, mech=False, bonus=50, profile=None, output=None, payoff=None):
+    '''
+    :param reputations: map (or array) of starting reputations
+    :param relationships: map, 2D array or store of relationships
+    :param maxIterations: most rounds of best responses to play
+    :param learningRate: how much every other nation's reputation changes after a nation moves (0 keeps them fixed)
+    :param weights: weights for the probability function (SampleSimulation's by default)
+    :param bias: constant added inside the probability function (SampleSimulation's by default)
+    :param mech: if True, cooperating uses the global support mechanism
+    :param bonus: extra util points for cooperating when mech is set
+    :param profile: array of length n, True for every nation cooperating at the start (if not given, the first
+    round can not count as converged)
+    :param output: where to report each round (see output.py), printed as text by default
+    :param payoff: PayoffModel for the utilities (see payoffs.py), SampleSimulation's constants (SAMPLE_PAYOFF) by
+    default, like runMultipleRounds
+    :return: (profile, iterations, converged, cycleLength): the last strategy profile (True for every nation that
+    cooperates), the number of rounds played, True if the last round was a fixed point, and the length of the cycle
+    that was found (0 if none)
+
+    Plays rounds of best responses like runMultipleRounds, but stops as soon as a whole round leaves the state as it
+    found it: no nation switches and no reputation moves (they can't when learningRate is 0, or once they are pinned
+    at 0 or 1). Only then is it a Nash equilibrium of the rounds, with every nation's choice its best response to
+    everyone else's; a round without switches while reputations are still moving is not, since the next round can
+    change the choices again. The state after every round (profile and reputations, compared with stateKey) is
+    hashed, so if play comes back to a state it has already been in without settling, it is caught as a cycle and the
+    search stops instead of going around it until maxIterations.
+    '''
+    output = output if output is not None else TextOutput()
+    payoff = payoff if payoff is not None else SAMPLE_PAYOFF
+    evaluator = IncrementalEvaluator(reputations, relationships, weights, bias, mech, bonus, payoff=payoff)
+    visited = {}
+    converged = False
+    cycleLength = 0
+    iterations = 0
+    previous = None if profile is None else stateKey(profile, evaluator.reputations)
+
+    while iterations < maxIterations:
+        iterations += 1
+        profile = playSequentialRound(evaluator, learningRate, output, iterations)
+        key = stateKey(profile, evaluator.reputations)
+        if key == previous:
+            converged = True
+            break
+        previous = key
+
+        if key in visited:
+            cycleLength = iterations - visited[key]
+            break
+        visited[key] = iterations
+
+    output.flush()
+    return profile, iterations, converged, cycleLength
+
+def generateReplicates(n, seeds, reputationRange=(0, 0.3), relationshipRange=(-0.5, 0.2), dtype=np.float64):
+    '''
+    :param n: number of players / nations
+    :param seeds: one random seed per replicate
+    :param reputationRange: (lower, upper) range for the random reputations
+    :param relationshipRange: (lower, upper) range for the random relationships
+    :param dtype: np.float64 or np.float32 (half the memory) for the relationships
+    :return: (reputations, relationships), R x n and R x n x n arrays. Replicate r is drawn from seeds[r] the same
+    way as Simulation.generate(n, reputationRange, relationshipRange, seeds[r])
+    '''
+    reputations = np.empty((len(seeds), n))
+    relationships = np.empty((len(seeds), n, n), dtype=dtype)
+    for r, seed in enumerate(seeds):
+        rng = np.random.default_rng(seed)
+        getRelationshipMatrix(n, *relationshipRange, rng, out=relationships[r])
+        reputations[r] = getReputationVector(n, *reputationRange, rng)
+    return reputations, relationships
+
+def runBatchRounds(reputations, relationships, numRounds=10, learningRate=0.05, weights=SAMPLE_WEIGHTS,
+                   bias=SAMPLE_BIAS, mech=False, bonus=50, payoff=None):
+    '''
+    :param reputations: R x n array of starting reputations, one row per replicate
+    :param relationships: R x n x n array of relationships, or one n x n array shared by every replicate
+    :param numRounds: number of rounds to simulate
+    :param learningRate: how much every other nation's reputation changes after a nation moves
+    :param weights: weights for the probability function (SampleSimulation's by default)
+    :param bias: constant added inside the probability function (SampleSimulation's by default)
+    :param mech: if True, cooperating uses the global support mechanism
+    :param bonus: extra util points for cooperating when mech is set
+    :param payoff: PayoffModel for the utilities (see payoffs.py), SampleSimulation's constants (SAMPLE_PAYOFF) by
+    default, like runMultipleRounds
+    :return: the final reputations (R x n array) and the percentage of nations cooperating in each round of each
+    replicate (R x numRounds array)
+
+    Plays R independent copies of runMultipleRounds side by side: replicate r gives the same numbers as
+    runMultipleRounds(reputations[r], relationships[r], ...). Every step (probabilities, sums, decisions and
+    reputation updates) is one array operation over all replicates, so thousands of them cost little more than one.
+    Decisions are compared as logs like IncrementalEvaluator.decide, so they stay right past the float range.
+    '''
+    reputations = np.array(reputations, dtype=np.float64)
+    relationships = np.asarray(relationships)
+    replicates, n = reputations.shape
+    w1, w2, w3 = weights
+    others = n - 1
+    sizes = np.arange(1, n)
+
+    payoff = payoff if payoff is not None else SAMPLE_PAYOFF
+    cooperatingTable, defectingTable = payoff.compile(n)
+    chosenTable = BonusPayoff(payoff, bonus).compile(n)[0] if mech else cooperatingTable
+    # cooperating utilities by number of nations defecting, for cooperating (choice 0) and defecting (choice 1)
+    cooperatingUtilities = [chosenTable[n - sizes], cooperatingTable[n - sizes]]
+    cooperatingUtilityNone = [chosenTable[0], cooperatingTable[0]]
+    defectingUtilities = defectingTable[sizes]
+
+    history = np.empty((replicates, numRounds))
+    record = instruments.current()
+    for roundNum in range(numRounds):
+        with record.phase("round", roundNum=roundNum + 1):
+            cooperationCount = np.zeros(replicates, dtype=int)
+
+            for i in range(n):
+                rows = relationships[:, i] if relationships.ndim == 3 else relationships[i]
+                otherNations = np.arange(n) != i
+                expected = []
+                for choice in (0, 1):
+                    if record.enabled:
+                        record.count("probabilityEvaluations", replicates * n)
+                    # same as IncrementalEvaluator.expectedUtility, for every replicate
+                    probCooperate = 1 / (1 + np.exp(-((reputations * w1) + (rows * w2) + (-choice * w3) + bias)))
+                    sumsCooperate, scaleCooperate = scaledElementarySymmetricRows(probCooperate[:, otherNations])
+                    sumsDefect, scaleDefect = scaledElementarySymmetricRows(1 - probCooperate[:, otherNations])
+                    cooperatingPart = probCooperate[:, i] * (
+                                sumsCooperate[:, :others][:, ::-1] @ cooperatingUtilities[choice])
+                    defectingPart = sumsDefect[:, 1:] @ defectingUtilities
+                    allDefect = sumsDefect[:, others] * defectingTable[others]
+                    allCooperate = sumsCooperate[:, others] * cooperatingUtilityNone[choice]
+                    res = allDefect + allCooperate + np.round(cooperatingPart + defectingPart, 2)
+                    signs, logs = signedLog(np.round(res, 2))
+
+                    # replicates whose sums were rescaled add the parts as logs, each on its own scale
+                    rescaled = (scaleCooperate != 0) | (scaleDefect != 0)
+                    if rescaled.any():
+                        parts = np.stack([cooperatingPart, defectingPart, allDefect, allCooperate], axis=1)
+                        scales = np.stack([scaleCooperate, scaleDefect, scaleDefect, scaleCooperate], axis=1)
+                        signs[rescaled], logs[rescaled] = signedScaledSum(parts[rescaled], scales[rescaled])
+                    expected.append((signs, logs))
+
+                cooperates = signedGreater(*expected)
+                cooperationCount += cooperates
+
+                # same as updateReputations, for every replicate
+                own = reputations[:, i].copy()
+                change = np.where(cooperates, learningRate, -learningRate)
+                np.clip(reputations + change[:, np.newaxis], 0, 1, out=reputations)
+                reputations[:, i] = own
+
+        history[:, roundNum] = cooperationCount / n * 100
+
+    return reputations, history
+
+def runReplicates(n, seeds, numRounds=10, reputationRange=(0, 0.3), relationshipRange=(-0.5, 0.2), **kwargs):
+    '''
+    :param n: number of players / nations
+    :param seeds: one random seed per replicate
+    :param numRounds: number of rounds to simulate
+    :param reputationRange: (lower, upper) range for the random reputations
+    :param relationshipRange: (lower, upper) range for the random relationships
+    :param kwargs: passed on to runBatchRounds (learningRate, weights, bias, mech, bonus, payoff)
+    :return: the final reputations (R x n array) and the cooperation history (R x numRounds array), see
+    runBatchRounds
+    '''
+    reputations, relationships = generateReplicates(n, seeds, reputationRange, relationshipRange)
+    return runBatchRounds(reputations, relationships, numRounds, **kwargs)
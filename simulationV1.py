@@ -1,10 +1,14 @@
 import random
+import tempfile
+import numpy as np
 # constant
 A = 10 # Base utility for building arms
 B = 8 # Base utility for not building arms (favors cooperation)
 X = 2 # Cost scaling factor for building arms (^ for discourage defecting)
 Y = 3 # Cost scaling factor for not building arms (^ to increase penalty)
 T = 0.2
+# most players (times trials) drawn at once by the large population functions, which bounds their memory
+CHUNK = 1000000
 
 def defect(n_b):
     return A - (X * n_b)
@@ -62,6 +66,144 @@ def randomApproach(players):
     print(" ")
     return sum(storePayoffs)
 
+def arithmeticSum(base, scalar, start, stop):
+    '''
+    :return: the sum of base - scalar * i for i from start to stop - 1 (the utilities of players start to stop - 1
+    when each one sees i players building arms before it), in O(1)
+    '''
+    count = max(0, stop - start)
+    return (count * base) - (scalar * ((count * (start + stop - 1)) // 2))
+
+def greedySplit(players):
+    '''
+    :param players: number of players
+    :return: (first, last, defectFirst): in the greedy approach player i sees i players building arms, and defecting
+    is better than cooperating for players first to last - 1 only (defectFirst is True if they come before the others)
+
+    defect(i) - cooperate(i) is a straight line in i, so the players who prefer defecting are one block at the start
+    or at the end.
+    '''
+    def defectBetter(i):
+        return defect(i) > cooperate(i)
+
+    slope = Y - X
+    if slope == 0:
+        return (0, players, True) if defectBetter(0) else (0, 0, True)
+    if slope > 0:
+        # defecting gets better as i grows: the defectors are at the end
+        first = min(players, max(0, int(np.floor((B - A) / slope)) + 1))
+        while first > 0 and defectBetter(first - 1):
+            first -= 1
+        while first < players and not defectBetter(first):
+            first += 1
+        return first, players, False
+    # defecting gets worse as i grows: the defectors are at the start
+    last = min(players, max(0, int(np.ceil((A - B) / -slope))))
+    while last > 0 and not defectBetter(last - 1):
+        last -= 1
+    while last < players and defectBetter(last):
+        last += 1
+    return 0, last, True
+
+def greedyUtilities(start, stop):
+    '''
+    :return: array of the utilities of players start to stop - 1 in the greedy approach (player i gets the better of
+    defect(i) and cooperate(i)), the same numbers greedyApproach stores
+    '''
+    builders = np.arange(start, stop)
+    return np.maximum(defect(builders), cooperate(builders))
+
+def greedyTotal(players, file=None):
+    '''
+    :param players: number of players
+    :param file: open text file to write the same per player messages as greedyApproach to, CHUNK players at a
+    time (nothing by default)
+    :return: the total utils for all the players, the same as greedyApproach, from closed forms in O(1)
+
+    Every player builds arms in the greedy approach, so player i sees i players building and gets
+    max(defect(i), cooperate(i)). Over a block of players with the same choice that is an arithmetic series.
+    '''
+    first, last, _ = greedySplit(players)
+    total = arithmeticSum(A, X, first, last) + arithmeticSum(B, Y, 0, first) + arithmeticSum(B, Y, last, players)
+
+    if file is not None:
+        for start in range(0, players, CHUNK):
+            utilities = greedyUtilities(start, min(players, start + CHUNK))
+            file.write("".join(f"Player {start + i + 1} defected. Util: {utility}\n"
+                               for i, utility in enumerate(utilities.tolist())))
+    return total
+
+def randomTotals(players, trials=1, rng=None, file=None):
+    '''
+    :param players: number of players
+    :param trials: number of random trials run together
+    :param rng: seed or numpy random Generator
+    :param file: open text file to write the same per player messages as randomApproach to (prefixed by the trial
+    when there is more than one), one trial after the other with its players in order (nothing by default)
+    :return: (totals, defectors): arrays of length trials with the total utils for all the players and the number of
+    players that defected in each trial
+
+    Same game as randomApproach (each player defects or cooperates with even odds, and sees the players that
+    defected before it building arms), but every trial is drawn at once with numpy. Players are taken CHUNK / trials
+    at a time, carrying the number of defectors so far, so memory doesn't grow with the number of players. When that
+    takes more than one chunk, the messages of each chunk are spilled to a temporary file and copied to file trial by
+    trial at the end, so the draws (and results) are the same with or without file.
+    '''
+    rng = np.random.default_rng(rng)
+    totals = np.zeros(trials, dtype=np.result_type(A, B, X, Y))
+    defectors = np.zeros(trials, dtype=np.int64)
+    chunk = max(1, CHUNK // trials)
+    spill = None
+    if file is not None and trials > 1 and players > chunk:
+        spill = tempfile.TemporaryFile()
+        # (offset, length) in spill of every chunk of messages, for each trial
+        sections = [[] for _ in range(trials)]
+
+    for start in range(0, players, chunk):
+        # True for every player that defects (random_number == 0 in randomApproach)
+        defects = rng.integers(0, 2, (trials, min(chunk, players - start)), dtype=np.bool_)
+        # players building arms when each player moves: the defectors before it
+        building = defectors[:, np.newaxis] + (np.cumsum(defects, axis=1, dtype=np.int32) - defects)
+        utilities = np.where(defects, defect(building), cooperate(building))
+        totals += utilities.sum(axis=1)
+        defectors += defects.sum(axis=1)
+
+        if file is not None:
+            for trial in range(trials):
+                prefix = f"Trial {trial + 1}: " if trials > 1 else ""
+                text = "".join(f"{prefix}Player {start + i + 1} {'defected' if defected else 'cooperated'}. "
+                               f"Util: {utility}\n" for i, (defected, utility)
+                               in enumerate(zip(defects[trial].tolist(), utilities[trial].tolist())))
+                if spill is None:
+                    file.write(text)
+                else:
+                    data = text.encode()
+                    sections[trial].append((spill.tell(), len(data)))
+                    spill.write(data)
+
+    if spill is not None:
+        with spill:
+            for trial in sections:
+                for offset, length in trial:
+                    spill.seek(offset)
+                    file.write(spill.read(length).decode())
+    return totals, defectors
+
+def compareApproaches(players, trials=1000, rng=None, file=None):
+    '''
+    :param players: number of players
+    :param trials: number of random trials
+    :param rng: seed or numpy random Generator
+    :param file: open text file to stream the per player messages of the greedy approach and then of the random
+    trials to (see greedyTotal and randomTotals), from the same trials the comparison is made of
+    :return: dict with the greedy total, the mean, smallest and largest random totals, and the share of random
+    trials that beat the greedy approach (what runSimulation compares, for any number of players)
+    '''
+    greedy = greedyTotal(players, file)
+    totals, _ = randomTotals(players, trials, rng, file)
+    return {"greedy": greedy, "randomMean": float(np.mean(totals)), "randomMin": totals.min().item(),
+            "randomMax": totals.max().item(), "randomBetter": float(np.mean(totals > greedy))}
+
 def runSimulation():
     print("Simulation of the Security Dilemma")
     print("----------------------------------\n")
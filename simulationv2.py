@@ -1,12 +1,44 @@
 import random
 import math
 import itertools
-
-def getRelationships(n, upper, lower):
+from statistics import NormalDist
+import numpy as np
+
+import instruments
+from output import TextOutput, DECISIONS, DETAILS
+from payoffs import DEFAULT_PAYOFF, BonusPayoff
+from stores import (getReputationVector, getRelationshipMatrix, asReputations, asRelationships,
+                    relationshipMatrix, setRelationship, BlockRelationships)
+
+# ways of summing over the combinations of other nations, see Simulation.combinationsUtility
+METHODS = ("subsets", "polynomial", "montecarlo")
+# number of samples the "montecarlo" method draws
+MONTE_CARLO_SAMPLES = 10000
+# most random numbers drawn at once when sampling, to bound memory for large n
+MONTE_CARLO_CHUNK = 4000000
+# most sums kept at once by the grouped pass over block relationships (see Simulation.groupedSums)
+GROUP_CHUNK = 4000000
+# scaledElementarySymmetric rescales its sums once the largest passes this, checking every RESCALE_EVERY values
+SCALE_LIMIT = 1e200
+RESCALE_EVERY = 64
+# the grouped pass over BlockRelationships only beats the dense one with enough nations and few groups, see usesGroups
+GROUPED_MIN_NATIONS = 512
+GROUPED_RATIO = 32
+
+# number types the all-nations pass can work in, see Simulation
+PRECISIONS = {"float64": np.float64, "float32": np.float32, "longdouble": np.longdouble}
+
+# weights for the probability function: (reputations, relationships, choice)
+WEIGHTS = (5, 3, 1)
+# constant added inside the probability function (SampleSimulation uses -1.1)
+BIAS = 0
+
+def getRelationships(n, upper, lower, rng=random):
     '''
     :param n: the number of players/nations
     :param upper: an upper bound for relationships (between -1 and 1)
     :param lower: a lower bound for relationships (between -1 and 1)
+    :param rng: where the random numbers come from (the random module, a random.Random or a numpy Generator)
     :return: map of relationships
 
     The key in the map we return will be a nation, and the value will be an array
@@ -30,15 +62,16 @@ def getRelationships(n, upper, lower):
             if j in relationships:
                 relationships[i][j] = (relationships[j][i])
                 continue
-            rand = random.uniform(lower, upper)
+            rand = float(rng.uniform(lower, upper))
             relationships[i][j] = rand
     return relationships
 
-def getReputations(n, lower, upper):
+def getReputations(n, lower, upper, rng=random):
     '''
     :param n: number of players/nations
     :param lower: lower range for reputation (between 0 - 1)
     :param upper: upper range for reputation (between 0 - 1)
+    :param rng: where the random numbers come from (the random module, a random.Random or a numpy Generator)
     :return: hash map of reputations, where the key is a nation and the value is their reputation. Size of hashmap is n
 
     Assigns each nation a random reputation that falls between the lower and upper bounds
@@ -46,7 +79,7 @@ def getReputations(n, lower, upper):
     reputation = dict()
 
     for i in range(n):
-        reputation[i] = random.uniform(lower, upper)
+        reputation[i] = float(rng.uniform(lower, upper))
 
     return reputation
 
@@ -61,17 +94,18 @@ def cooperatingUtility(numPlayersDefecting, cooperatingUtility=15, cooperatingSc
     '''
     return cooperatingUtility - (cooperatingScalar * math.log(1 + numPlayersDefecting))
 
-def cooperatingUtilityMech(numPlayersDefecting, cooperatingUtility=15, cooperatingScalar=2):
+def cooperatingUtilityMech(numPlayersDefecting, cooperatingUtility=15, cooperatingScalar=2, bonus=50):
     '''
     :param numPlayersDefecting: number of players defecting
     :param cooperatingUtility: A constant that represents the base utility for cooperating
     :param cooperatingScalar: A constant that represents the base cost for cooperating
+    :param bonus: extra util points given by the global support mechanism
     :return: utility that represent cooperating
 
     This models our cooperating utility function found in the readMe.
     This utility function has an additional mechanism to encourage cooperation. It provides 50 extra util points!
     '''
-    return cooperatingUtility - (cooperatingScalar * math.log(1 + numPlayersDefecting)) + 50
+    return cooperatingUtility - (cooperatingScalar * math.log(1 + numPlayersDefecting)) + bonus
 
 def defectingUtility(numPlayersDefecting, defectingUtility=30, defectingScalar=3):
     '''
@@ -96,14 +130,49 @@ def probabiltiy(a, b, choice):
     weights were chosen to represent the amount of importance each value has in calculating
     the probability
     '''
-    w1 = 5 # for reputations
-    w2 = 3 # for relationships
-    w3 = 1 # for choice
+    w1, w2, w3 = WEIGHTS # for reputations, relationships and choice
+    record = instruments.current()
+    if record.enabled:
+        record.count("probabilityEvaluations")
 
-    x = (reputations[b] * w1) + (relationships[a][b] * w2) + (-choice * w3)
+    x = (reputations[b] * w1) + (relationships[a][b] * w2) + (-choice * w3) + BIAS
 
     return 1 / (1 + math.exp(-x))
 
+def getProbabilityTensor(reputations, relationships, weights=WEIGHTS, bias=BIAS, dtype=np.float64):
+    '''
+    :param reputations: map (or array) of reputations, see getReputations
+    :param relationships: map, 2D array or store of relationships, see getRelationships and stores.py
+    :param weights: weights for reputations, relationships and choice
+    :param bias: constant added inside the probability function
+    :param dtype: np.float64, np.float32 (half the memory) or np.longdouble (more precision)
+    :return: n x n x 2 numpy array, where [a, b, choice] is the probability that nation b will cooperate when nation a
+    makes that choice (0 for cooperating, 1 for defecting)
+
+    Same values as probabiltiy, but computed for every pair and both choices at once.
+    '''
+    x = getLogits(reputations, relationships, weights[:2], bias, dtype)
+    x = x[:, :, np.newaxis] - (np.array([0, 1], dtype=dtype) * weights[2])
+
+    return 1 / (1 + np.exp(-x))
+
+def getLogits(reputations, relationships, weights=WEIGHTS[:2], bias=BIAS, dtype=np.float64):
+    '''
+    :param weights: weights for reputations and relationships
+    :return: n x n array of what the probability function passes through the sigmoid when a nation cooperates,
+    see getProbabilityTensor. The weight for the choice is subtracted from it when the nation defects
+    '''
+    reputationVector = np.asarray(asReputations(reputations)).astype(dtype, copy=False)
+    w1, w2 = weights
+    relationshipValues = relationshipMatrix(relationships).astype(dtype, copy=False)
+    return (reputationVector[np.newaxis, :] * w1) + (relationshipValues * w2) + bias
+
+def logSigmoid(x):
+    '''
+    :return: log(1 / (1 + exp(-x))), without going through the probability (which rounds to 0 or 1 for large x)
+    '''
+    return -np.logaddexp(0, -x)
+
 def get_combinations(arr):
     '''
     :param arr: An array of all (n-1) nations. EX: If there are 5 nations, and we want all combinations
@@ -122,6 +191,1098 @@ def get_combinations(arr):
     # Convert tuples to lists
     return [list(combo) for combo in result]
 
+def elementarySymmetric(values):
+    '''
+    :param values: an array of numbers (probabilities in our case)
+    :return: an array e of length len(values) + 1, where e[k] is the sum, over every subset of size k, of the product of
+    the values in that subset. e[0] is always 1 (the empty subset)
+
+    Each value multiplies the running polynomial by (1 + value * x), and e[k] is the coefficient of x^k. This is the same
+    recursion that builds a Poisson-binomial count distribution, and it takes O(n^2) instead of visiting all 2^n subsets.
+    '''
+    e = np.zeros(len(values) + 1)
+    e[0] = 1.0
+
+    for count, value in enumerate(values, start=1):
+        # the right hand side is computed before the update, so e[k - 1] is still the value from before this factor
+        e[1:count + 1] += value * e[:count]
+
+    return e
+
+def scaledElementarySymmetric(values, limit=SCALE_LIMIT):
+    '''
+    :param values: an array of numbers (probabilities in our case)
+    :param limit: largest sum kept before rescaling
+    :return: (e, logScale), where e * exp(logScale) is elementarySymmetric(values)
+
+    The same recursion, but every RESCALE_EVERY values the sums are divided by the largest of them once it passes
+    limit, and the log of that is added to logScale. Adding a value at most doubles a sum, so they never overflow
+    however many values there are. Until the limit is reached nothing is rescaled, so for the usual sizes e is exactly
+    elementarySymmetric(values) and logScale is 0.
+    '''
+    e = np.zeros(len(values) + 1)
+    e[0] = 1.0
+    logScale = 0.0
+
+    for count, value in enumerate(values, start=1):
+        e[1:count + 1] += value * e[:count]
+        if count % RESCALE_EVERY == 0:
+            largest = np.max(e[:count + 1])
+            if largest > limit:
+                e[:count + 1] /= largest
+                logScale += math.log(largest)
+
+    return e, logScale
+
+def elementarySymmetricRows(matrix):
+    '''
+    :param matrix: R x m array, one set of values (probabilities) per row
+    :return: R x (m + 1) array, where row r is elementarySymmetric(matrix[r])
+
+    The same recursion as elementarySymmetric, run for every row at once.
+    '''
+    rows, count = matrix.shape
+    # built as e[k, r] so every update works on whole contiguous rows, and transposed at the end
+    e = np.zeros((count + 1, rows), dtype=matrix.dtype)
+    e[0] = 1.0
+    for j in range(count):
+        e[1:j + 2] += matrix[:, j] * e[:j + 1]
+    return e.T
+
+def scaledElementarySymmetricRows(matrix, limit=SCALE_LIMIT):
+    '''
+    :param matrix: R x m array, one set of values (probabilities) per row
+    :param limit: largest sum kept before rescaling
+    :return: (e, logScale), where row r of e times exp(logScale[r]) is elementarySymmetric(matrix[r])
+
+    The same recursion as elementarySymmetricRows, with every row rescaled on its own like scaledElementarySymmetric.
+    Rows that never pass the limit are exactly elementarySymmetricRows and have a logScale of 0.
+    '''
+    rows, count = matrix.shape
+    e = np.zeros((count + 1, rows), dtype=matrix.dtype)
+    e[0] = 1.0
+    logScale = np.zeros(rows)
+    for j in range(count):
+        e[1:j + 2] += matrix[:, j] * e[:j + 1]
+        if (j + 1) % RESCALE_EVERY == 0:
+            largest = np.max(e[:j + 2], axis=0)
+            large = largest > limit
+            if large.any():
+                e[:j + 2, large] /= largest[large]
+                logScale[large] += np.log(largest[large])
+    return e.T, logScale
+
+def elementarySymmetricGrouped(values):
+    '''
+    :param values: an array of numbers (probabilities in our case)
+    :return: the same array as elementarySymmetric(values)
+
+    Equal values are multiplied in together: a value v that appears m times is the factor (1 + v * x)^m, whose
+    coefficients are binomial, so there is one convolution per distinct value instead of one update per value.
+    '''
+    e = np.ones(1, dtype=values.dtype)
+    distinct, counts = np.unique(values, return_counts=True)
+    for value, count in zip(distinct, counts):
+        j = np.arange(1, count + 1)
+        # coefficients of (1 + value * x)^count: C(count, j) * value^j
+        factor = np.concatenate(([1.0], np.cumprod((count - j + 1) / j * value)))
+        e = np.convolve(e, factor)
+    return e
+
+def scaledElementarySymmetricGrouped(values):
+    '''
+    :param values: an array of numbers (probabilities in our case)
+    :return: (e, logScale), where e * exp(logScale) is elementarySymmetricGrouped(values)
+
+    The same convolutions as elementarySymmetricGrouped, but each factor is built from its logs and the sums are
+    divided by the largest of them after every convolution, like scaledElementarySymmetricAllNations, so nothing
+    overflows however many values there are.
+    '''
+    e = np.ones(1, dtype=values.dtype)
+    logScale = 0.0
+    distinct, counts = np.unique(values, return_counts=True)
+    with np.errstate(divide="ignore"):
+        for value, count in zip(distinct, counts):
+            j = np.arange(1, count + 1)
+            logFactor = np.concatenate(([0.0], np.cumsum(np.log((count - j + 1) / j) + np.log(value))))
+            top = np.max(logFactor)
+            e = np.convolve(e, np.exp(logFactor - top).astype(values.dtype))
+            largest = np.max(e)
+            e /= largest
+            logScale += top + np.log(largest)
+    return e, logScale
+
+def removeFactors(sums, values):
+    '''
+    :param sums: elementary symmetric sums (see elementarySymmetric) of some values, length n + 1
+    :param values: array of m of those values
+    :return: m x n array, where row i is the elementary symmetric sums without values[i]
+
+    Divides the polynomial by (1 + values[i] * x) for every i at once. Like rounds.removeFactor, the division goes
+    forward while that is stable and backward from the top after that; here both directions are worked out for every
+    value and each row takes the forward part up to its own switch point.
+    '''
+    top = len(sums) - 1
+    # built as [k, i] so every step works on a whole contiguous row
+    forward = np.empty((top, len(values)), dtype=values.dtype)
+    backward = np.empty((top, len(values)), dtype=values.dtype)
+    with np.errstate(divide="ignore", over="ignore", invalid="ignore"):
+        forward[0] = sums[0]
+        for k in range(1, top):
+            forward[k] = sums[k] - values * forward[k - 1]
+        backward[top - 1] = sums[top] / values
+        for k in range(top - 1, 0, -1):
+            backward[k - 1] = (sums[k] - backward[k]) / values
+
+        # the forward division is used up to the first k where it shrinks faster than the value (or all the way,
+        # which the last row of True stands for)
+        unstable = np.vstack([forward[1:] < values * forward[:-1], np.ones((1, len(values)), dtype=bool)])
+    split = np.argmax(unstable, axis=0) + 1
+    useForward = np.arange(top)[:, np.newaxis] < split
+    return np.where(useForward, forward, backward).T
+
+def leaveOneOutProducts(matrix):
+    '''
+    :param matrix: n x n array, where row i holds a value for every nation from nation i's point of view
+    :return: array of length n, where entry i is the product of row i without the diagonal entry matrix[i, i]
+
+    Uses prefix and suffix products of every row (no division, so a probability of exactly 0 is fine).
+    The product without entry i is then prefix[i, i] * suffix[i, i].
+    '''
+    n = len(matrix)
+    ones = np.ones((n, 1))
+    # prefix[i, j] is the product of matrix[i, :j]
+    prefix = np.cumprod(np.hstack([ones, matrix[:, :-1]]), axis=1)
+    # suffix[i, j] is the product of matrix[i, j + 1:]
+    suffix = np.cumprod(np.hstack([ones, matrix[:, :0:-1]]), axis=1)[:, ::-1]
+
+    diagonal = np.arange(n)
+    return prefix[diagonal, diagonal] * suffix[diagonal, diagonal]
+
+def elementarySymmetricAllNations(matrix):
+    '''
+    :param matrix: n x n array, where row i holds a value (probability) for every nation from nation i's point of view
+    :return: n x n array e, where e[i, k] is the elementary symmetric sum of size k (see elementarySymmetric) of row i,
+    leaving out nation i itself
+
+    Builds every nation's "everyone but me" sums in the same pass: column j is added to every row at once, and
+    nation j's own row gets a neutral factor instead.
+    '''
+    n = len(matrix)
+    # built as e[k, i] so every update works on whole contiguous rows, and transposed at the end
+    e = np.zeros((n, n), dtype=matrix.dtype)
+    e[0] = 1.0
+    buffer = np.empty((n, n), dtype=matrix.dtype)
+
+    for j in range(n):
+        values = matrix[:, j].copy()
+        # nation j is not one of its own other nations
+        values[j] = 0.0
+        top = min(j + 1, n - 1)
+        added = buffer[:top]
+        np.multiply(e[:top], values, out=added)
+        e[1:top + 1] += added
+
+    return e.T
+
+def scaledElementarySymmetricAllNations(matrix, rescaleEvery=64):
+    '''
+    :param matrix: n x n array, where row i holds a value (probability) for every nation from nation i's point of view
+    :param rescaleEvery: number of columns added between rescalings
+    :return: (e, logScale), where e[i, k] * exp(logScale[i]) is elementarySymmetricAllNations(matrix)[i, k]
+
+    The same pass as elementarySymmetricAllNations, but every rescaleEvery columns each nation's sums are divided by
+    the largest of them and the log of that is added to its scale. Adding a column at most doubles a sum, so they never
+    overflow, however large n is. Sums far below a nation's largest one round to 0, which only drops terms far too
+    small to change its expected utility.
+    '''
+    n = len(matrix)
+    e = np.zeros((n, n), dtype=matrix.dtype)
+    e[0] = 1.0
+    buffer = np.empty((n, n), dtype=matrix.dtype)
+    logScale = np.zeros(n)
+
+    for j in range(n):
+        values = matrix[:, j].copy()
+        values[j] = 0.0
+        top = min(j + 1, n - 1)
+        added = buffer[:top]
+        np.multiply(e[:top], values, out=added)
+        e[1:top + 1] += added
+
+        if (j + 1) % rescaleEvery == 0:
+            largest = np.max(e[:top + 1], axis=0)
+            e[:top + 1] /= largest
+            logScale += np.log(largest)
+
+    return e.T, logScale
+
+def signedLogSumExp(logs, signs, axis=-1):
+    '''
+    :param logs: logs of the absolute values of the terms
+    :param signs: signs of the terms (1, -1 or 0)
+    :param axis: axis to sum along
+    :return: (sign, log of the absolute value) of the sum of the terms
+
+    Everything is scaled by the largest term before exp, so the sum never leaves the float range.
+    '''
+    with np.errstate(divide="ignore", invalid="ignore"):
+        top = np.max(np.where(signs != 0, logs, -np.inf), axis=axis, keepdims=True)
+        top = np.where(np.isfinite(top), top, 0)
+        total = np.sum(signs * np.exp(logs - top), axis=axis)
+        return np.sign(total), np.log(np.abs(total)) + np.squeeze(top, axis)
+
+def signedScaledSum(parts, logScales, axis=-1):
+    '''
+    :param parts: numbers to add, each to be multiplied by exp of its log scale first
+    :param logScales: log scales of the parts (same shape)
+    :param axis: axis to sum along
+    :return: (sign, log of the absolute value) of the sum, see signedLogSumExp
+    '''
+    with np.errstate(divide="ignore"):
+        return signedLogSumExp(np.log(np.abs(parts)) + logScales, np.sign(parts), axis)
+
+def signedLog(values):
+    '''
+    :return: (signs, logs of the absolute values) of some numbers, the form signedGreater compares
+    '''
+    with np.errstate(divide="ignore"):
+        return np.sign(values), np.log(np.abs(values))
+
+def signedGreater(first, second):
+    '''
+    :param first: (signs, logs) of some numbers, see signedLogSumExp
+    :param second: (signs, logs) of as many other numbers
+    :return: array, True where the first number is larger than the second
+    '''
+    (signsFirst, logsFirst), (signsSecond, logsSecond) = first, second
+    larger = np.where(signsFirst > 0, logsFirst > logsSecond, logsFirst < logsSecond)
+    return np.where(signsFirst == signsSecond, larger & (signsFirst != 0), signsFirst > signsSecond)
+
+class CombinationsSampler:
+    '''
+    Estimates the total utility for all possible combinations (Simulation.combinationsSubsets) by sampling.
+
+    The sum over subsets S of (product of q over S) * U^D(|S|) is Z * E[U^D(K)], where Z is the product of (1 + q)
+    over the other nations and K counts the defectors in a random subset that includes each nation j with
+    probability q_j / (1 + q_j). The cooperating half works the same way with p. So each sample draws a set of
+    defectors (and one of cooperators) and gives an unbiased estimate of the whole sum.
+
+    Z grows like 2^n, so samples are kept divided by exp(logScale) and the caller multiplies it back in.
+    '''
+
+    def __init__(self, probabilities, currNation, otherNations, choice, tables=None):
+        '''
+        :param probabilities: the probability tensor, see getProbabilityTensor
+        :param currNation: represents the nation that is making the choice to either defect or cooperate
+        :param otherNations: an array of all (n-1) nations, not including currNation
+        :param choice: if currNation is cooperating or defecting
+        :param tables: the utility tables for cooperating and defecting (see PayoffModel.compile), the readMe's by
+        default
+        '''
+        cooperatingTable, defectingTable = tables if tables is not None else DEFAULT_PAYOFF.compile(len(probabilities))
+        probCooperate = probabilities[currNation, otherNations, choice]
+        probDefect = 1 - probCooperate
+        probSelf = probabilities[currNation, currNation, choice]
+        others = len(otherNations)
+
+        # chance of each nation being drawn into the set of defectors / cooperators
+        self.drawDefect = probDefect / (1 + probDefect)
+        self.drawCooperate = probCooperate / (1 + probCooperate)
+
+        logScaleDefect = np.sum(np.log1p(probDefect))
+        logScaleCooperate = np.sum(np.log1p(probCooperate)) + np.log(probSelf)
+        self.logScale = max(logScaleDefect, logScaleCooperate)
+
+        # utility by number drawn. k defectors (k >= 1) gives U^D(k), m cooperators (m <= n - 2) means
+        # k = n - 1 - m defectors, which gives U^C(n - k) = U^C(m + 1)
+        self.defectValues = np.concatenate(([0.0], defectingTable[1:others + 1]))
+        self.defectValues *= np.exp(logScaleDefect - self.logScale)
+        self.cooperateValues = np.concatenate((cooperatingTable[1:others + 1], [0.0]))
+        self.cooperateValues *= np.exp(logScaleCooperate - self.logScale)
+
+        # the exact (not sampled) terms for all nations defecting and all nations cooperating, scaled the same way
+        logAllDefect = np.sum(np.log(probDefect))
+        logAllCooperate = np.sum(np.log(probCooperate))
+        self.exactTerms = (np.exp(logAllDefect - self.logScale) * defectingTable[others]) + (
+                    np.exp(logAllCooperate - self.logScale) * cooperatingTable[0])
+
+    def draw(self, size, rng):
+        '''
+        :param size: number of samples
+        :param rng: numpy random Generator
+        :return: array of size samples of the total utility for all possible combinations, divided by exp(logScale)
+        '''
+        others = len(self.drawDefect)
+        rows = max(1, MONTE_CARLO_CHUNK // max(1, 2 * others))
+        values = np.empty(size)
+
+        for start in range(0, size, rows):
+            stop = min(size, start + rows)
+            numDefect = np.count_nonzero(rng.random((stop - start, others)) < self.drawDefect, axis=1)
+            numCooperate = np.count_nonzero(rng.random((stop - start, others)) < self.drawCooperate, axis=1)
+            values[start:stop] = self.defectValues[numDefect] + self.cooperateValues[numCooperate]
+
+        return values
+
+class Simulation:
+    '''
+    One game: the nations' reputations and relationships, the weights of the probability function, the global support
+    bonus and a random number generator. Every expected utility is computed from these, so separate Simulation
+    objects can run at the same time (in threads or in a worker pool) without sharing any module state.
+
+    The probability tensor (see getProbabilityTensor) is built the first time it is needed, and rebuilt only after
+    the reputations or relationships are changed through one of the set methods (or invalidate is called after
+    changing the arrays in place).
+    '''
+
+    def __init__(self, reputations, relationships, weights=WEIGHTS, bias=BIAS, bonus=50, seed=None, payoff=None,
+                 precision="float64", logSpace=False):
+        '''
+        :param reputations: map (or array) of reputations, see getReputations
+        :param relationships: map, 2D array or store of relationships, see getRelationships and stores.py. Arrays
+        and stores are used as they are, not copied, so a memory-mapped matrix (stores.loadArray) stays on disk
+        :param weights: weights for reputations, relationships and choice in the probability function
+        :param bias: constant added inside the probability function
+        :param bonus: extra util points for cooperating with the global support mechanism
+        :param seed: seed (or numpy random Generator) for the random numbers used when sampling
+        :param payoff: PayoffModel for the utilities (see payoffs.py), the readMe's log model by default
+        :param precision: number type of the probability tensor and the all-nations sums, "float64", "float32" (half
+        the memory, but the sums overflow past a couple of hundred nations unless logSpace is set) or "longdouble"
+        (more digits and a much larger range, where the platform has it)
+        :param logSpace: if True, the all-nations pass keeps every probability, sum and utility as a log (see
+        logExpectedUtilitiesForChoice), so nothing underflows to 0 or overflows to inf however large n is
+        '''
+        self.n = len(reputations)
+        self.players = list(range(self.n))
+        self.reputations = np.array(asReputations(reputations), dtype=np.float64)
+        self.relationships = asRelationships(relationships)
+        self.weights = tuple(weights)
+        self.bias = bias
+        self.bonus = bonus
+        self.rng = np.random.default_rng(seed)
+        self.payoff = payoff if payoff is not None else DEFAULT_PAYOFF
+        self.precision = precision
+        self.dtype = PRECISIONS[precision]
+        self.logSpace = logSpace
+        self._probabilities = None
+        # compiled utility tables, by (payoff model, mech, bonus)
+        self._tables = {}
+
+    @classmethod
+    def generate(cls, n, reputationRange=(0, 0.3), relationshipRange=(-0.5, 0.2), seed=None, dtype=np.float64,
+                 **kwargs):
+        '''
+        :param n: number of players / nations
+        :param reputationRange: (lower, upper) range for the random reputations
+        :param relationshipRange: (lower, upper) range for the random relationships
+        :param seed: seed for the random reputations, relationships and sampling
+        :param dtype: np.float64 or np.float32 (half the memory) for the relationship matrix
+        :param kwargs: passed on to Simulation (weights, bias, bonus)
+        :return: a Simulation with random reputations and relationships
+        '''
+        rng = np.random.default_rng(seed)
+        relationships = getRelationshipMatrix(n, *relationshipRange, rng, dtype)
+        reputations = getReputationVector(n, *reputationRange, rng)
+        return cls(reputations, relationships, seed=rng, **kwargs)
+
+    @property
+    def probabilities(self):
+        '''
+        the n x n x 2 probability tensor, see getProbabilityTensor
+        '''
+        if self._probabilities is None:
+            record = instruments.current()
+            if record.enabled:
+                record.count("probabilityEvaluations", self.n * self.n * 2)
+            with record.phase("probabilities"):
+                self._probabilities = getProbabilityTensor(self.reputations, self.relationships, self.weights,
+                                                           self.bias, self.dtype)
+        return self._probabilities
+
+    def invalidate(self):
+        '''
+        Forces the probability tensor to be rebuilt. Use this after changing reputations or relationships in place.
+        '''
+        self._probabilities = None
+
+    def setReputations(self, reputations):
+        self.reputations = np.array(asReputations(reputations), dtype=np.float64)
+        self.invalidate()
+
+    def setReputation(self, nation, value):
+        self.reputations[nation] = value
+        self.invalidate()
+
+    def setRelationships(self, relationships):
+        self.relationships = asRelationships(relationships)
+        self.invalidate()
+
+    def setRelationship(self, a, b, value):
+        # relationships are symmetric
+        setRelationship(self.relationships, a, b, value)
+        self.invalidate()
+
+    def payoffModel(self, mech=False):
+        '''
+        :param mech: if True, uses the global support mechanism
+        :return: the PayoffModel, with this bonus added to cooperating if mech is set
+        '''
+        return BonusPayoff(self.payoff, self.bonus) if mech else self.payoff
+
+    def payoffTables(self, mech=False):
+        '''
+        :param mech: if True, uses the global support mechanism
+        :return: the utility tables for cooperating and for defecting (see PayoffModel.compile), compiled the first
+        time they are asked for
+        '''
+        key = (self.payoff, mech, self.bonus if mech else None)
+        if key not in self._tables:
+            self._tables[key] = self.payoffModel(mech).compile(self.n)
+        return self._tables[key]
+
+    def combinationsSubsets(self, currNation, combinations, choice, mech=False):
+        '''
+        :param currNation: represents the nation that is making the choice to either defect or cooperate
+        :param combinations: a 2D array of nations. We assume that each nation in the subarrays will defect. Any nation
+        not in this subarray will cooperate
+        :param choice: if currNation is cooperating or defecting
+        :param mech: if True, uses the global support mechanism
+        :return: total utility for all possible combinations
+
+        This function sums the utility over all subsets of players excluding the current nation based on the probability
+        of each player cooperating and defecting
+        '''
+        probabilities = self.probabilities
+        cooperatingTable, defectingTable = self.payoffTables(mech)
+        totalUtility = 0
+        record = instruments.current()
+        if record.enabled:
+            record.count("subsets", len(combinations))
+
+        # for each array in combinations
+        for combo in combinations:
+            percentOfCooperate = 1
+            percentOfDefect = 1
+
+            for otherNation in combo:
+                # all players in combo assumed to defect
+                percentOfDefect *= (1 - probabilities[currNation, otherNation, choice])
+
+            for otherNation in self.players:
+                if otherNation not in combo:
+                    # all players NOT in combo assumed to cooperate
+                    percentOfCooperate *= probabilities[currNation, otherNation, choice]
+            # get total utility
+            totalUtility += (percentOfCooperate * cooperatingTable[self.n - len(combo)]) + (
+                        percentOfDefect * defectingTable[len(combo)])
+        # round to two decimal points
+        return round(float(totalUtility), 2)
+
+    def combinationsPolynomial(self, currNation, otherNations, choice, mech=False):
+        '''
+        :param currNation: represents the nation that is making the choice to either defect or cooperate
+        :param otherNations: an array of all (n-1) nations, not including currNation
+        :param choice: if currNation is cooperating or defecting
+        :param mech: if True, uses the global support mechanism
+        :return: total utility for all possible combinations
+
+        Gives the same number as combinationsSubsets without going through every subset.
+
+        For a subset S of defecting nations the summand is
+            (product of p over every player not in S) * U^C(n - |S|) + (product of (1 - p) over S) * U^D(|S|)
+        Summing the products over every subset of the same size k gives elementary symmetric sums, so we only need
+        one sum per size instead of one per subset. Note that "every player not in S" includes currNation itself,
+        which is why the cooperating half is scaled by currNation's own probability.
+
+        The sums grow like 2^n, so past roughly a thousand nations they are rescaled as they are built
+        (scaledElementarySymmetric) and the two halves are added as logs. A total beyond the float range comes out as
+        inf (never NaN).
+        '''
+        probabilities = self.probabilities
+        cooperatingTable, defectingTable = self.payoffTables(mech)
+        probCooperate = probabilities[currNation, otherNations, choice]
+        probDefect = 1 - probCooperate
+        probSelf = probabilities[currNation, currNation, choice]
+
+        sumsDefect, scaleDefect = scaledElementarySymmetric(probDefect)
+        sumsCooperate, scaleCooperate = scaledElementarySymmetric(probCooperate)
+        others = len(otherNations)
+
+        if scaleCooperate == 0 and scaleDefect == 0:
+            totalUtility = 0
+            # k is the number of nations in the subset (defecting), same as len(combo) in combinationsSubsets
+            for k in range(1, others + 1):
+                totalUtility += (probSelf * sumsCooperate[others - k] * cooperatingTable[self.n - k]) + (
+                            sumsDefect[k] * defectingTable[k])
+            # round to two decimal points
+            return round(float(totalUtility), 2)
+
+        # the sums were rescaled, so each half is summed on its own scale and they are added as logs
+        k = np.arange(1, others + 1)
+        halves = np.array([probSelf * (sumsCooperate[others - k] @ cooperatingTable[self.n - k]),
+                           sumsDefect[k] @ defectingTable[k]])
+        sign, log = signedScaledSum(halves, np.array([scaleCooperate, scaleDefect]))
+        with np.errstate(over="ignore"):
+            return round(float(sign * np.exp(log)), 2)
+
+    def combinationsMonteCarlo(self, currNation, otherNations, choice, mech=False, samples=MONTE_CARLO_SAMPLES):
+        '''
+        :param currNation: represents the nation that is making the choice to either defect or cooperate
+        :param otherNations: an array of all (n-1) nations, not including currNation
+        :param choice: if currNation is cooperating or defecting
+        :param mech: if True, uses the global support mechanism
+        :param samples: number of samples to draw
+        :return: estimate of the total utility for all possible combinations, and its standard error
+
+        Estimates combinationsSubsets by sampling (see CombinationsSampler).
+        '''
+        sampler = CombinationsSampler(self.probabilities, currNation, otherNations, choice, self.payoffTables(mech))
+        values = sampler.draw(samples, self.rng)
+        scale = np.exp(sampler.logScale)
+        standardError = np.std(values, ddof=1) / math.sqrt(samples) if samples > 1 else math.inf
+        return round(float(np.mean(values) * scale), 2), float(standardError * scale)
+
+    def combinationsUtility(self, currNation, otherNations, choice, method, mech=False):
+        '''
+        :param currNation: represents the nation that is making the choice to either defect or cooperate
+        :param otherNations: an array of all (n-1) nations, not including currNation
+        :param choice: if currNation is cooperating or defecting
+        :param method: "subsets" to sum over every subset (2^(n-1) of them), "polynomial" to use the O(n^2) sums, or
+        "montecarlo" to estimate the sum from MONTE_CARLO_SAMPLES samples
+        :param mech: if True, uses the global support mechanism
+        :return: total utility for all possible combinations
+
+        "subsets" and "polynomial" give the same result. "subsets" is kept as the reference and for checking the faster one.
+        "montecarlo" gives an estimate; use decideMonteCarlo to get confidence intervals and stop early.
+        '''
+        if method == "subsets":
+            with instruments.current().phase("subsets", nation=currNation):
+                return self.combinationsSubsets(currNation, get_combinations(otherNations), choice, mech)
+        if method == "polynomial":
+            return self.combinationsPolynomial(currNation, otherNations, choice, mech)
+        if method == "montecarlo":
+            estimate, _ = self.combinationsMonteCarlo(currNation, otherNations, choice, mech)
+            return estimate
+        raise ValueError(f"Unknown method {method!r}, expected one of {METHODS}")
+
+    def allOthersProbabilities(self, thisCountry, choice):
+        '''
+        :param thisCountry: represents the nation that is making the choice to either defect or cooperate
+        :param choice: if thisCountry is cooperating (0) or defecting (1)
+        :return: total probability of all other nations cooperating, and of all of them defecting
+        '''
+        probCooperate = np.delete(self.probabilities[thisCountry, :, choice], thisCountry)
+        return float(np.prod(probCooperate)), float(np.prod(1 - probCooperate))
+
+    def expectedUtility(self, thisCountry, choice, method="polynomial", mech=False):
+        '''
+        :param thisCountry: represents the nation that is making the choice to either defect or cooperate
+        :param choice: if thisCountry is cooperating (0) or defecting (1)
+        :param method: how to sum over the combinations, "polynomial" (default), "subsets" or "montecarlo"
+        (see combinationsUtility)
+        :param mech: if True, uses the global support mechanism
+        :return: total utility for thisCountry making that choice
+
+        With logSpace the "polynomial" method goes through logExpectedUtility. Either way a utility beyond the float
+        range comes out as inf; compare those with logExpectedUtility.
+        '''
+        if self.logSpace and method == "polynomial":
+            sign, log = self.logExpectedUtility(thisCountry, choice, mech)
+            with np.errstate(over="ignore"):
+                return round(float(sign * np.exp(log)), 2)
+
+        otherNations = [j for j in range(self.n) if j != thisCountry]
+        totalProbCooperate, totalProbDefect = self.allOthersProbabilities(thisCountry, choice)
+
+        # Gets total utility for all combinations
+        combinations = self.combinationsUtility(thisCountry, otherNations, choice, method, mech)
+        # Gets total utility when everyone defects
+        cooperatingTable, defectingTable = self.payoffTables(mech)
+        totalPDUtility = totalProbDefect * defectingTable[self.n - 1]
+        # Gets total utility when everyone cooperates
+        totalPCUtility = totalProbCooperate * cooperatingTable[0]
+
+        res = totalPDUtility + totalPCUtility + combinations
+        return round(float(res), 2)
+
+    def logProbabilityRow(self, thisCountry, choice):
+        '''
+        :param thisCountry: the nation making the choice
+        :param choice: if thisCountry is cooperating (0) or defecting (1)
+        :return: two arrays of length n, the logs of the probability of every nation cooperating when thisCountry
+        makes that choice and of 1 minus it (row thisCountry of logOthersProbabilities), without building the tensor
+        '''
+        w1, w2, w3 = self.weights
+        row = np.asarray(self.relationships[thisCountry], dtype=np.float64)
+        x = (self.reputations * w1) + (row * w2) - (choice * w3) + self.bias
+        return logSigmoid(x), logSigmoid(-x)
+
+    def logExpectedUtility(self, thisCountry, choice, mech=False):
+        '''
+        :param thisCountry: represents the nation that is making the choice to either defect or cooperate
+        :param choice: if thisCountry is cooperating (0) or defecting (1)
+        :param mech: if True, uses the global support mechanism
+        :return: (sign, log): the sign of thisCountry's expected utility for that choice and the log of its absolute
+        value, which compare correctly (signedGreater) however large n is
+
+        Row thisCountry of logExpectedUtilitiesForChoice, built from one row of probabilities with the sums rescaled as
+        they grow (scaledElementarySymmetric), in O(n^2) like the "polynomial" method.
+        '''
+        logProbCooperate, logProbDefect = self.logProbabilityRow(thisCountry, choice)
+        otherNations = np.arange(self.n) != thisCountry
+        sumsCooperate, scaleCooperate = scaledElementarySymmetric(np.exp(logProbCooperate[otherNations]))
+        sumsDefect, scaleDefect = scaledElementarySymmetric(np.exp(logProbDefect[otherNations]))
+        # one row of logCountSums
+        sums = (logProbCooperate[[thisCountry]], sumsCooperate[np.newaxis], np.array([scaleCooperate]),
+                sumsDefect[np.newaxis], np.array([scaleDefect]), np.array([np.sum(logProbCooperate[otherNations])]),
+                np.array([np.sum(logProbDefect[otherNations])]))
+        signs, logs = self.logUtilitiesFromSums(mech, *sums)
+        return float(signs[0]), float(logs[0])
+
+    def expectedUtilityCooperating(self, thisCountry, method="polynomial", mech=False):
+        '''
+        :return: total utility assuming that thisCountry is cooperating, see expectedUtility
+        '''
+        return self.expectedUtility(thisCountry, 0, method, mech)
+
+    def expectedUtilityDefecting(self, thisCountry, method="polynomial"):
+        '''
+        :return: total utility assuming that thisCountry is defecting, see expectedUtility
+        '''
+        return self.expectedUtility(thisCountry, 1, method)
+
+    def usesGroups(self):
+        '''
+        :return: True if the all-nations passes go group by group (see groupedSums): the relationships are
+        BlockRelationships with at least GROUPED_MIN_NATIONS nations and at most n / GROUPED_RATIO groups. Otherwise
+        the relationships are expanded (toMatrix) and go through the dense pass, which is faster at those sizes
+        '''
+        if not isinstance(self.relationships, BlockRelationships) or self.n < GROUPED_MIN_NATIONS:
+            return False
+        return self.relationships.groupCount() * GROUPED_RATIO <= self.n
+
+    def groupLogits(self, choice):
+        '''
+        :param choice: if the nations are cooperating (0) or defecting (1)
+        :return: yields (nations, x, xSelf) for every group of BlockRelationships.groups, what the probability function
+        passes through the sigmoid for the probabilities of groupProbabilities
+        '''
+        w1, w2, w3 = self.weights
+        reputations = self.reputations.astype(self.dtype, copy=False)
+        for nations, row in self.relationships.groups():
+            x = (reputations * w1) + (row.astype(self.dtype, copy=False) * w2) + (-choice * w3) + self.bias
+            xSelf = (reputations[nations] * w1) + (-choice * w3) + self.bias
+            yield nations, x, xSelf
+
+    def groupProbabilities(self, choice):
+        '''
+        :param choice: if the nations are cooperating (0) or defecting (1)
+        :return: yields (nations, probCooperate, probSelf) for every group of BlockRelationships.groups: probCooperate
+        is the probability of every nation cooperating when one of the group's nations makes that choice (the entries
+        for the group's own nations are what another member of the group would see), and probSelf is each member's
+        probability of cooperating itself, like the diagonal of the probability tensor
+        '''
+        for nations, x, xSelf in self.groupLogits(choice):
+            yield nations, 1 / (1 + np.exp(-x)), 1 / (1 + np.exp(-xSelf))
+
+    def groupedSums(self, choice):
+        '''
+        :param choice: if the nations are cooperating (0) or defecting (1)
+        :return: yields (nations, probSelf, sumsCooperate, sumsDefect), where row i of the sums holds the elementary
+        symmetric sums of the probabilities of every other nation cooperating / defecting when nations[i] makes that
+        choice (the same as row nations[i] of elementarySymmetricAllNations)
+
+        Only for BlockRelationships (see usesGroups). The nations of a group see every other nation the same way, so the group's sums
+        are built once over all n nations (grouping equal probabilities, see elementarySymmetricGrouped) and then each
+        member's own factor is taken out (removeFactors). The probability tensor is never built, and groups are
+        handed out in chunks of at most GROUP_CHUNK sums.
+        '''
+        chunk = max(1, GROUP_CHUNK // self.n)
+        for nations, probCooperate, probSelf in self.groupProbabilities(choice):
+            sumsCooperate = elementarySymmetricGrouped(probCooperate)
+            sumsDefect = elementarySymmetricGrouped(1 - probCooperate)
+            for start in range(0, len(nations), chunk):
+                members = nations[start:start + chunk]
+                own = probCooperate[members]
+                yield (members, probSelf[start:start + chunk], removeFactors(sumsCooperate, own),
+                       removeFactors(sumsDefect, 1 - own))
+
+    def allOthersProbabilitiesAllNations(self, choice):
+        '''
+        :param choice: if the nations are cooperating (0) or defecting (1)
+        :return: two arrays of length n. Entry i of the first is the total probability of all other nations cooperating
+        when nation i makes that choice, and entry i of the second is the total probability of all of them defecting
+        '''
+        if self.logSpace:
+            logProbCooperate, logProbDefect = self.logAllOthersProbabilitiesAllNations(choice)
+            return np.exp(logProbCooperate), np.exp(logProbDefect)
+
+        if self.usesGroups():
+            totalProbCooperate, totalProbDefect = np.empty(self.n), np.empty(self.n)
+            for nations, probCooperate, _ in self.groupProbabilities(choice):
+                own = probCooperate[nations]
+                totalProbCooperate[nations] = np.prod(probCooperate) / own
+                totalProbDefect[nations] = np.prod(1 - probCooperate) / (1 - own)
+            return totalProbCooperate, totalProbDefect
+
+        probCooperate = self.probabilities[:, :, choice]
+        return leaveOneOutProducts(probCooperate), leaveOneOutProducts(1 - probCooperate)
+
+    def countSums(self, choice):
+        '''
+        :param choice: if the nations are cooperating (0) or defecting (1)
+        :return: yields (nations, probSelf, sumsCooperate, sumsDefect, totalProbCooperate, totalProbDefect) for all
+        nations, possibly in several chunks. Row i of the sums holds the elementary symmetric sums of the probabilities
+        of every other nation cooperating / defecting when nations[i] makes that choice, and the totals are the
+        probabilities of all of them cooperating / defecting (see allOthersProbabilitiesAllNations)
+
+        With BlockRelationships that are worth it (see usesGroups) this goes group by group (see groupedSums), otherwise every nation is done in one
+        pass over the probability tensor (see elementarySymmetricAllNations).
+        '''
+        if self.usesGroups():
+            others = self.n - 1
+            for nations, probSelf, sumsCooperate, sumsDefect in self.groupedSums(choice):
+                # the last sums are the products of all of them
+                yield nations, probSelf, sumsCooperate, sumsDefect, sumsCooperate[:, others], sumsDefect[:, others]
+            return
+
+        probCooperate = self.probabilities[:, :, choice]
+        totalProbCooperate, totalProbDefect = self.allOthersProbabilitiesAllNations(choice)
+        yield (np.arange(self.n), np.diagonal(probCooperate), elementarySymmetricAllNations(probCooperate),
+               elementarySymmetricAllNations(1 - probCooperate), totalProbCooperate, totalProbDefect)
+
+    def expectedUtilitiesForChoice(self, choice, mech=False):
+        '''
+        :param choice: if the nations are cooperating (0) or defecting (1)
+        :param mech: if True, uses the global support mechanism
+        :return: array of length n with every nation's expected utility for that choice
+
+        Entry i is the same number expectedUtility gives for nation i, computed for all nations together (see
+        countSums). With BlockRelationships (see usesGroups) the work grows with the number of groups instead of n. With logSpace,
+        this is exp of logExpectedUtilitiesForChoice (inf where the utility is beyond the float range). Without it,
+        nations whose sums overflow are worked out on the logs the same way, so they also come out as inf (never NaN);
+        use cooperatesAllNations to compare those.
+        '''
+        if self.logSpace:
+            signs, logs = self.logExpectedUtilitiesForChoice(choice, mech)
+            with np.errstate(over="ignore"):
+                return np.round(signs * np.exp(logs), 2)
+
+        n = self.n
+        cooperatingTable, defectingTable = self.payoffTables(mech)
+        others = n - 1
+        # number of nations defecting in a combination, same as k in combinationsPolynomial
+        sizes = np.arange(1, others + 1)
+        cooperatingUtilities = cooperatingTable[n - sizes]
+        defectingUtilities = defectingTable[sizes]
+
+        res = np.empty(n)
+        with np.errstate(over="ignore", invalid="ignore"):
+            for nations, probSelf, sumsCooperate, sumsDefect, totalProbCooperate, totalProbDefect in self.countSums(
+                    choice):
+                combinations = (probSelf * (sumsCooperate[:, others - sizes] @ cooperatingUtilities)) + (
+                            sumsDefect[:, sizes] @ defectingUtilities)
+                combinations = np.round(combinations, 2)
+
+                res[nations] = (totalProbDefect * defectingTable[n - 1]) + (
+                            totalProbCooperate * cooperatingTable[0]) + combinations
+        res = np.round(res, 2)
+
+        overflowed = ~np.isfinite(res)
+        if overflowed.any():
+            # the sums left the float range (around a thousand nations for float64, a couple of hundred for float32),
+            # so those nations are worked out again on the logs
+            signs, logs = self.logExpectedUtilitiesForChoice(choice, mech)
+            with np.errstate(over="ignore"):
+                res[overflowed] = np.round(signs[overflowed] * np.exp(logs[overflowed]), 2)
+        return res
+
+    def logOthersProbabilities(self, choice):
+        '''
+        :param choice: if the nations are cooperating (0) or defecting (1)
+        :return: two n x n arrays, the logs of [:, :, choice] of the probability tensor and of 1 minus it, worked out
+        from the probability function directly so neither rounds to log 0
+        '''
+        x = getLogits(self.reputations, self.relationships, self.weights[:2], self.bias, self.dtype) - (
+                    choice * self.weights[2])
+        return logSigmoid(x), logSigmoid(-x)
+
+    def logAllOthersProbabilitiesAllNations(self, choice):
+        '''
+        :return: the logs of allOthersProbabilitiesAllNations(choice), which stay meaningful long after the
+        probabilities themselves are too small for a float
+        '''
+        logProbCooperate, logProbDefect = self.logOthersProbabilities(choice)
+        return (np.sum(logProbCooperate, axis=1) - np.diagonal(logProbCooperate),
+                np.sum(logProbDefect, axis=1) - np.diagonal(logProbDefect))
+
+    def logCountSums(self, choice):
+        '''
+        :param choice: if the nations are cooperating (0) or defecting (1)
+        :return: yields (nations, logSelf, sumsCooperate, scaleCooperate, sumsDefect, scaleDefect, logTotalCooperate,
+        logTotalDefect), countSums with everything kept as logs: row i of sumsCooperate times exp(scaleCooperate[i]) is
+        the elementary symmetric sums of countSums (see scaledElementarySymmetricAllNations), logSelf is the log of
+        probSelf and the totals are logs of the total probabilities
+
+        With BlockRelationships that are worth it (see usesGroups) this goes group by group like groupedSums (see scaledElementarySymmetricGrouped),
+        otherwise every nation is done in one pass over the logs of the probabilities (see logOthersProbabilities).
+        '''
+        if self.usesGroups():
+            chunk = max(1, GROUP_CHUNK // self.n)
+            for nations, x, xSelf in self.groupLogits(choice):
+                logCooperate, logDefect = logSigmoid(x), logSigmoid(-x)
+                sumsCooperate, scaleCooperate = scaledElementarySymmetricGrouped(np.exp(logCooperate))
+                sumsDefect, scaleDefect = scaledElementarySymmetricGrouped(np.exp(logDefect))
+                logSelf = logSigmoid(xSelf)
+                for start in range(0, len(nations), chunk):
+                    members = nations[start:start + chunk]
+                    size = len(members)
+                    # taking a factor out can leave sums that should be tiny slightly below 0, which are dropped
+                    yield (members, logSelf[start:start + chunk],
+                           np.maximum(removeFactors(sumsCooperate, np.exp(logCooperate[members])), 0),
+                           np.full(size, scaleCooperate),
+                           np.maximum(removeFactors(sumsDefect, np.exp(logDefect[members])), 0),
+                           np.full(size, scaleDefect), np.sum(logCooperate) - logCooperate[members],
+                           np.sum(logDefect) - logDefect[members])
+            return
+
+        logProbCooperate, logProbDefect = self.logOthersProbabilities(choice)
+        sumsCooperate, scaleCooperate = scaledElementarySymmetricAllNations(np.exp(logProbCooperate))
+        sumsDefect, scaleDefect = scaledElementarySymmetricAllNations(np.exp(logProbDefect))
+        yield (np.arange(self.n), np.diagonal(logProbCooperate), sumsCooperate, scaleCooperate, sumsDefect, scaleDefect,
+               np.sum(logProbCooperate, axis=1) - np.diagonal(logProbCooperate),
+               np.sum(logProbDefect, axis=1) - np.diagonal(logProbDefect))
+
+    def logExpectedUtilitiesForChoice(self, choice, mech=False):
+        '''
+        :param choice: if the nations are cooperating (0) or defecting (1)
+        :param mech: if True, uses the global support mechanism
+        :return: (signs, logs), two arrays of length n with the sign of every nation's expected utility for that
+        choice and the log of its absolute value
+
+        The same sum as expectedUtilitiesForChoice, with the probabilities and every term kept as logs and added with
+        signedLogSumExp, and the elementary symmetric sums rescaled as they grow (see logCountSums). Utilities can be
+        negative, which is why the sign is kept apart. The terms are not rounded to two decimals on the way.
+        '''
+        signs, logs = np.empty(self.n), np.empty(self.n)
+        for nations, *sums in self.logCountSums(choice):
+            signs[nations], logs[nations] = self.logUtilitiesFromSums(mech, *sums)
+        return signs, logs
+
+    def logUtilitiesFromSums(self, mech, logSelf, sumsCooperate, scaleCooperate, sumsDefect, scaleDefect,
+                             totalProbCooperate, totalProbDefect):
+        '''
+        :param mech: if True, uses the global support mechanism
+        :return: (signs, logs) of the expected utilities of some nations, from their rows of logCountSums (everything
+        after the nations)
+        '''
+        n = self.n
+        others = n - 1
+        sizes = np.arange(1, others + 1)
+        cooperatingTable, defectingTable = self.payoffTables(mech)
+        utilities = np.concatenate([cooperatingTable[n - sizes], defectingTable[sizes], [defectingTable[n - 1]],
+                                    [cooperatingTable[0]]]).astype(self.dtype)
+
+        # the same terms as expectedUtilitiesForChoice
+        with np.errstate(divide="ignore"):
+            terms = np.concatenate([logSelf[:, np.newaxis] + np.log(sumsCooperate[:, others - sizes])
+                                    + scaleCooperate[:, np.newaxis],
+                                    np.log(sumsDefect[:, sizes]) + scaleDefect[:, np.newaxis],
+                                    totalProbDefect[:, np.newaxis], totalProbCooperate[:, np.newaxis]], axis=1)
+            terms += np.log(np.abs(utilities))
+        return signedLogSumExp(terms, np.sign(utilities))
+
+    def bonusTerms(self):
+        '''
+        :return: three arrays of length n for every nation cooperating: the combinations part of its expected utility
+        without any bonus, how much that part grows for every point of bonus, and the total probability of all other
+        nations cooperating
+
+        The global support bonus is added to every cooperating utility, so the expected utility for cooperating is a
+        straight line in the bonus, and these terms give it for any bonus without summing over the combinations
+        again (see thresholds.bonusThresholds).
+        '''
+        n = self.n
+        others = n - 1
+        sizes = np.arange(1, others + 1)
+        cooperatingTable, defectingTable = self.payoffTables()
+        cooperatingUtilities = cooperatingTable[n - sizes]
+        defectingUtilities = defectingTable[sizes]
+
+        base, perBonus, totalProbCooperateAll = np.empty(n), np.empty(n), np.empty(n)
+        for nations, probSelf, sumsCooperate, sumsDefect, totalProbCooperate, _ in self.countSums(0):
+            base[nations] = (probSelf * (sumsCooperate[:, others - sizes] @ cooperatingUtilities)) + (
+                        sumsDefect[:, sizes] @ defectingUtilities)
+            perBonus[nations] = probSelf * np.sum(sumsCooperate[:, others - sizes], axis=1)
+            totalProbCooperateAll[nations] = totalProbCooperate
+        return base, perBonus, totalProbCooperateAll
+
+    def cooperatesAllNations(self, expCooperating, expDefecting, mech=False):
+        '''
+        :param expCooperating: every nation's expected utility for cooperating, see expectedUtilitiesAllNations
+        :param expDefecting: every nation's expected utility for defecting
+        :param mech: if True, cooperating uses the global support mechanism
+        :return: array of length n, True for every nation whose expected utility for cooperating is larger
+
+        Utilities beyond the float range come out as inf and can't be compared, so those nations are decided on the
+        logs (logExpectedUtilitiesForChoice) instead.
+        '''
+        cooperates = expCooperating > expDefecting
+        overflowed = ~(np.isfinite(expCooperating) & np.isfinite(expDefecting))
+        if overflowed.any():
+            logCooperating = self.logExpectedUtilitiesForChoice(0, mech)
+            logDefecting = self.logExpectedUtilitiesForChoice(1)
+            cooperates[overflowed] = signedGreater(logCooperating, logDefecting)[overflowed]
+        return cooperates
+
+    def expectedUtilitiesAllNations(self, mech=False):
+        '''
+        :param mech: if True, cooperating uses the global support mechanism
+        :return: two arrays of length n, the expected utility of every nation for cooperating and for defecting
+
+        One vectorized pass instead of calling expectedUtilityCooperating and expectedUtilityDefecting once per nation.
+        '''
+        with instruments.current().phase("allNations"):
+            return self.expectedUtilitiesForChoice(0, mech), self.expectedUtilitiesForChoice(1)
+
+    def decideMonteCarlo(self, thisCountry, mech=False, confidence=0.95, batchSize=1000, maxSamples=100000):
+        '''
+        :param thisCountry: represents the nation that is making the choice to either defect or cooperate
+        :param mech: if True, cooperating uses the global support mechanism
+        :param confidence: confidence level of the intervals
+        :param batchSize: number of samples drawn for each choice before checking if we can stop
+        :param maxSamples: most samples drawn for each choice
+        :return: (True if thisCountry cooperates, (expected utility for cooperating, for defecting),
+        (half width of the confidence interval for cooperating, for defecting), samples drawn for each choice)
+
+        Estimates the expected utilities for cooperating and defecting by sampling, and stops as soon as the confidence
+        interval of their difference no longer contains 0 (so the choice is decided), or after maxSamples.
+        '''
+        otherNations = [j for j in range(self.n) if j != thisCountry]
+        samplers = [CombinationsSampler(self.probabilities, thisCountry, otherNations, 0, self.payoffTables(mech)),
+                    CombinationsSampler(self.probabilities, thisCountry, otherNations, 1, self.payoffTables())]
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+
+        # compare both choices on the larger of the two scales
+        logScale = max(sampler.logScale for sampler in samplers)
+        rescale = [np.exp(sampler.logScale - logScale) for sampler in samplers]
+
+        sums = np.zeros(2)
+        sumsOfSquares = np.zeros(2)
+        samples = 0
+        while samples < maxSamples:
+            size = min(batchSize, maxSamples - samples)
+            for i, sampler in enumerate(samplers):
+                values = sampler.draw(size, self.rng)
+                sums[i] += np.sum(values)
+                sumsOfSquares[i] += np.sum(values ** 2)
+            samples += size
+
+            means = (sums / samples) + np.array([sampler.exactTerms for sampler in samplers])
+            variances = np.maximum(sumsOfSquares / samples - (sums / samples) ** 2, 0) * samples / max(1, samples - 1)
+            standardErrors = np.sqrt(variances / samples) * rescale
+            difference = (means[0] * rescale[0]) - (means[1] * rescale[1])
+            if abs(difference) > z * math.sqrt(np.sum(standardErrors ** 2)):
+                break
+
+        # for very large n the utilities themselves are too big for a float and come out as inf, but the choice is
+        # still decided on the common scale above
+        with np.errstate(over="ignore", invalid="ignore"):
+            scale = np.exp(logScale)
+            estimates = means * rescale * scale
+            halfWidths = z * standardErrors * scale
+        return bool(difference > 0), (float(estimates[0]), float(estimates[1])), (float(halfWidths[0]), float(halfWidths[1])), samples
+
+    def playRound(self, mech=False, output=None):
+        '''
+        :param mech: if True, cooperating uses the global support mechanism
+        :param output: where to report each nation's turn (see output.py), printed as text by default
+        :return: array of length n, True for every nation that chooses to cooperate
+
+        Every nation compares its expected utility for cooperating and defecting, and chooses the larger one.
+        '''
+        output = output if output is not None else TextOutput()
+        if self.logSpace:
+            # decided on the logs, so utilities beyond the float range still compare correctly
+            logCooperating = self.logExpectedUtilitiesForChoice(0, mech)
+            logDefecting = self.logExpectedUtilitiesForChoice(1)
+            cooperates = signedGreater(logCooperating, logDefecting)
+            with np.errstate(over="ignore"):
+                expCooperating, expDefecting = [np.round(signs * np.exp(logs), 2) for signs, logs in
+                                                (logCooperating, logDefecting)]
+        else:
+            expCooperating, expDefecting = self.expectedUtilitiesAllNations(mech)
+            cooperates = self.cooperatesAllNations(expCooperating, expDefecting, mech)
+        if not output.enabled(DECISIONS):
+            return cooperates
+
+        details = output.enabled(DETAILS)
+        if details:
+            probsIfCooperate = self.allOthersProbabilitiesAllNations(0)
+            probsIfDefect = self.allOthersProbabilitiesAllNations(1)
+            if self.logSpace:
+                logsIfCooperate = self.logAllOthersProbabilitiesAllNations(0)
+                logsIfDefect = self.logAllOthersProbabilitiesAllNations(1)
+
+        for i in range(self.n):
+            output.write("turn", {"nation": i})
+            if details:
+                considerCooperate = {"nation": i, "choice": "cooperates", "probAllCooperate": float(probsIfCooperate[0][i]),
+                                     "probAllDefect": float(probsIfCooperate[1][i])}
+                considerDefect = {"nation": i, "choice": "defects", "probAllCooperate": float(probsIfDefect[0][i]),
+                                  "probAllDefect": float(probsIfDefect[1][i])}
+                if self.logSpace:
+                    considerCooperate.update(logProbAllCooperate=float(logsIfCooperate[0][i]),
+                                             logProbAllDefect=float(logsIfCooperate[1][i]))
+                    considerDefect.update(logProbAllCooperate=float(logsIfDefect[0][i]),
+                                          logProbAllDefect=float(logsIfDefect[1][i]))
+                output.write("consider", considerCooperate)
+                output.write("consider", considerDefect)
+            output.write("utilities", {"nation": i, "cooperating": float(expCooperating[i]),
+                                       "defecting": float(expDefecting[i])})
+            output.write("decision", {"nation": i, "action": "cooperate" if cooperates[i] else "defect"})
+        output.flush()
+
+        return cooperates
+
+# The functions below are the original interface of this script. They read n, players, reputations and relationships
+# from module globals (set in the main block, or by whoever imports this module), and go through a Simulation built
+# from those globals. New code should create its own Simulation instead.
+
+# the Simulation built from the globals, and the globals it was built from
+_globalSimulation = {"reputations": None, "relationships": None, "parameters": None, "simulation": None}
+
+def getGlobalSimulation():
+    '''
+    :return: a Simulation for the current module globals (reputations, relationships, WEIGHTS and BIAS)
+
+    It is only rebuilt when reputations or relationships are replaced (for example reputations = getReputations(...))
+    or the weights change. If one of them is changed in place, call invalidateProbabilities first.
+    '''
+    parameters = (WEIGHTS, BIAS)
+    if (_globalSimulation["reputations"] is not reputations or _globalSimulation["relationships"] is not relationships
+            or _globalSimulation["parameters"] != parameters or _globalSimulation["simulation"] is None):
+        # keep a reference to the inputs so we can tell when they are replaced
+        _globalSimulation["reputations"] = reputations
+        _globalSimulation["relationships"] = relationships
+        _globalSimulation["parameters"] = parameters
+        _globalSimulation["simulation"] = Simulation(reputations, relationships, WEIGHTS, BIAS)
+    return _globalSimulation["simulation"]
+
+def getProbabilities():
+    '''
+    :return: the probability tensor (see getProbabilityTensor) for the current reputations and relationships
+    '''
+    return getGlobalSimulation().probabilities
+
+def invalidateProbabilities():
+    '''
+    Forces the next call to rebuild the probability tensor. Use this after changing reputations or relationships in
+    place.
+    '''
+    _globalSimulation["simulation"] = None
+
 def getExpectedUtilityCombinations(currNation, combinations, choice):
     '''
     :param currNation: represents the nation that is making the choice to either defect or cooperate
@@ -134,26 +1295,7 @@ def getExpectedUtilityCombinations(currNation, combinations, choice):
     cooperating and defecting
 
     '''
-    totalUtility = 0
-
-    # for each array in combinations
-    for combo in combinations:
-        percentOfCooperate = 1
-        percentOfDefect = 1
-
-        for otherNation in combo:
-            # all players in combo assumed to defect
-            percentOfDefect *= (1 - probabiltiy(currNation, otherNation, choice))
-
-        for otherNation in players:
-            if otherNation not in combo:
-                # all players NOT in combo assumed to cooperate
-                percentOfCooperate *= probabiltiy(currNation, otherNation, choice)
-        # get total utility
-        totalUtility += (percentOfCooperate * cooperatingUtility(n - len(combo))) + (
-                    percentOfDefect * defectingUtility(len(combo)))
-    # round to two decimal points
-    return round(totalUtility, 2)
+    return getGlobalSimulation().combinationsSubsets(currNation, combinations, choice)
 
 def getExpectedUtilityCombinationsMech(currNation, combinations, choice):
     '''
@@ -165,164 +1307,131 @@ def getExpectedUtilityCombinationsMech(currNation, combinations, choice):
 
     This represents the complex summation part of the equation in readMe
 
-    This function sums the utility over all subsets of players excluding the current nation based on the probability of each player
-    cooperating and defecting
-
     Same as getExpectedUtilityCombinations, except this uses the global support mechanism (uses cooperatingUtilityMech function instead
     of the cooperatingUtility function)
     '''
-    # for defecting
-    totalUtility = 0
+    return getGlobalSimulation().combinationsSubsets(currNation, combinations, choice, mech=True)
 
-    for combo in combinations:
-        percentOfCooperate = 1
-        percentOfDefect = 1
+def getExpectedUtilityCombinationsPolynomial(currNation, otherNations, choice, mech=False):
+    '''
+    :param currNation: represents the nation that is making the choice to either defect or cooperate
+    :param otherNations: an array of all (n-1) nations, not including currNation
+    :param choice: if currNation is cooperating or defecting
+    :param mech: if True, uses the global support mechanism
+    :return: total utility for all possible combinations
 
-        for otherNation in combo:
-            percentOfDefect *= (1 - probabiltiy(currNation, otherNation, choice))
+    Gives the same number as getExpectedUtilityCombinations without going through every subset, see
+    Simulation.combinationsPolynomial.
+    '''
+    return getGlobalSimulation().combinationsPolynomial(currNation, otherNations, choice, mech)
 
-        for otherNation in players:
-            if otherNation not in combo:
-                percentOfCooperate *= probabiltiy(currNation, otherNation, choice)
-        totalUtility += (percentOfCooperate * cooperatingUtilityMech(n - len(combo))) + (
-                    percentOfDefect * defectingUtility(len(combo)))
-    return round(totalUtility, 2)
+def getExpectedUtilityCombinationsMonteCarlo(currNation, otherNations, choice, mech=False, samples=MONTE_CARLO_SAMPLES):
+    '''
+    :return: estimate of the total utility for all possible combinations, and its standard error. See
+    Simulation.combinationsMonteCarlo
+    '''
+    return getGlobalSimulation().combinationsMonteCarlo(currNation, otherNations, choice, mech, samples)
 
-def getExpectedUtilityCooperating(thisCountry, n, choice=True):
+def getCombinationsUtility(currNation, otherNations, choice, method, mech=False):
+    '''
+    :return: total utility for all possible combinations, using the given method. See Simulation.combinationsUtility
+    '''
+    return getGlobalSimulation().combinationsUtility(currNation, otherNations, choice, method, mech)
+
+def getExpectedUtilityCooperating(thisCountry, n, choice=True, method="polynomial", output=None):
     '''
     :param thisCountry: represents the nation that is making the choice to either defect or cooperate
     :param n: number of players / nations
     :param choice: if thisCountry is cooperating or defecting. Always set to True ( 1 ).
+    :param method: how to sum over the combinations, "polynomial" (default), "subsets" or "montecarlo"
+    (see getCombinationsUtility)
+    :param output: where to report what thisCountry considers (see output.py), printed as text by default
     :return: total utility assuming that thisCountry is cooperating
     '''
+    output = output if output is not None else TextOutput()
+    simulation = getGlobalSimulation()
 
-    # total probability of all nations defecting
-    totalProbDefect = 1
-    # total probability of all nations cooperating
-    totalProbCooperate = 1
-    otherNations = []
-
-    for j in range(n):
-        # skip thisCountry
-        if thisCountry == j:
-            continue
-
-        otherNations.append(j)
-        # prob of j cooperating when i cooperates
-        probCC = probabiltiy(thisCountry, j, 0)
-        # prob of j defects when i cooperates
-        probCD = 1 - probCC
+    if output.enabled(DETAILS):
+        totalProbCooperate, totalProbDefect = simulation.allOthersProbabilities(thisCountry, 0)
+        output.write("consider", {"nation": thisCountry, "choice": "cooperates", "probAllCooperate": totalProbCooperate,
+                                  "probAllDefect": totalProbDefect})
+        output.flush()
 
-        totalProbDefect *= probCD
-        totalProbCooperate *= probCC
+    with instruments.current().phase("expectedUtility", nation=thisCountry):
+        return simulation.expectedUtilityCooperating(thisCountry, method)
 
-    # Gets total utility for all combinations
-    combinations = getExpectedUtilityCombinations(thisCountry, get_combinations(otherNations), 0)
-    # Gets total utility when everyone defects
-    totalPDUtility = totalProbDefect * defectingUtility(n - 1)
-    # Gets total utility when everyone cooperates
-    totalPCUtility = totalProbCooperate * cooperatingUtility(0)
-
-    print(f"Now nation {thisCountry + 1} is considering what all other nations will do when nation {thisCountry + 1} cooperates")
-    print(f"If nation {thisCountry + 1} cooperates, the total probability of all other nations cooperating is {round(totalProbCooperate * 100, 2)}%, and")
-    print(f"the total probability of all other nations defecting is {round(totalProbDefect * 100, 2)}%")
-
-    res = totalPDUtility + totalPCUtility + combinations
-    return round(res, 2)
-
-def getExpectedUtilityCooperatingMech(thisCountry, n, choice=True):
+def getExpectedUtilityCooperatingMech(thisCountry, n, choice=True, method="polynomial", output=None):
     '''
     :param thisCountry: represents the nation that is making the choice to either defect or cooperate
     :param n: number of players / nations
     :param choice: if thisCountry is cooperating or defecting. Always set to True ( 1 ).
+    :param method: how to sum over the combinations, "polynomial" (default), "subsets" or "montecarlo"
+    (see getCombinationsUtility)
+    :param output: where to report what thisCountry considers (see output.py), printed as text by default
     :return: total utility assuming that thisCountry is cooperating
 
     Same as above but with global support mechanism!
     '''
+    output = output if output is not None else TextOutput()
+    simulation = getGlobalSimulation()
 
-    # total probability of all nations defecting
-    totalProbDefect = 1
-    # total probability of all nations cooperating
-    totalProbCooperate = 1
-    otherNations = []
+    if output.enabled(DETAILS):
+        totalProbCooperate, totalProbDefect = simulation.allOthersProbabilities(thisCountry, 0)
+        output.write("consider", {"nation": thisCountry, "choice": "cooperates", "probAllCooperate": totalProbCooperate,
+                                  "probAllDefect": totalProbDefect})
+        output.flush()
 
-    for j in range(n):
-        if thisCountry == j:
-            continue
+    with instruments.current().phase("expectedUtility", nation=thisCountry):
+        return simulation.expectedUtilityCooperating(thisCountry, method, mech=True)
 
-        otherNations.append(j)
-        # prob of j cooperating when i cooperates
-        probCC = probabiltiy(thisCountry, j, 0)
-        # prob of j defects when i cooperates
-        probCD = 1 - probCC
-
-        totalProbDefect *= probCD
-        totalProbCooperate *= probCC
-
-    # Gets total utility for all combinations
-    combinations = getExpectedUtilityCombinationsMech(thisCountry, get_combinations(otherNations), 0)
-    # Gets total utility when everyone defects
-    totalPD = totalProbDefect * defectingUtility(n - 1)
-    # Gets total utility when everyone cooperates
-    totalPC = totalProbCooperate * cooperatingUtilityMech(0)
-
-    print(f"Now nation {thisCountry + 1} is considering what all other nations will do when nation {thisCountry + 1} cooperates")
-    print(f"If nation {thisCountry + 1} cooperates, the total probability of all other nations cooperating is {round(totalProbCooperate * 100, 2)}%")
-    print(f"If nation {thisCountry + 1} cooperates, the total probability of all other nations defecting is {round(totalProbDefect * 100, 2)}%")
-
-    res = totalPD + totalPC + combinations
-    return round(res, 2)
-
-def getExpectedUtilityDefecting(thisCountry, n, choice=False):
+def getExpectedUtilityDefecting(thisCountry, n, choice=False, method="polynomial", output=None):
     '''
     :param thisCountry: represents the nation that is making the choice to either defect or cooperate
     :param n: number of players / nations
     :param choice: if thisCountry is cooperating or defecting. Always set to False ( 0 ).
+    :param method: how to sum over the combinations, "polynomial" (default), "subsets" or "montecarlo"
+    (see getCombinationsUtility)
+    :param output: where to report what thisCountry considers (see output.py), printed as text by default
     :return: total utility assuming that thisCountry is defecting
     '''
+    output = output if output is not None else TextOutput()
+    simulation = getGlobalSimulation()
 
-    # total probability of all nations defecting
-    totalProbDefect = 1
-    # total probability of all nations cooperating
-    totalProbCooperate = 1
-    otherNations = []
+    if output.enabled(DETAILS):
+        totalProbCooperate, totalProbDefect = simulation.allOthersProbabilities(thisCountry, 1)
+        output.write("consider", {"nation": thisCountry, "choice": "defects", "probAllCooperate": totalProbCooperate,
+                                  "probAllDefect": totalProbDefect})
+        output.flush()
 
-    for j in range(n):
-        if thisCountry == j:
-            continue
-
-        otherNations.append(j)
-        # prob of j cooperating when i defect
-        probDC = probabiltiy(thisCountry, j, 1)
-        # prob of j defecting when i defect
-        probDD = 1 - probDC
-
-        totalProbDefect *= probDD
-        totalProbCooperate *= probDC
-
-    # Gets total utility for all combinations
-    combinationsUtility = getExpectedUtilityCombinations(thisCountry, get_combinations(otherNations), 1)
-    # Gets total utility when everyone defects
-    totalPDUtility = totalProbDefect * defectingUtility(n - 1)
-    # Gets total utility when everyone cooperates
-    totalPCUtility = totalProbCooperate * cooperatingUtility(0)
-
-    print(f"Now nation {thisCountry + 1} is considering what all other nations will do when nation {thisCountry + 1} defects")
-    print(
-        f"If nation {thisCountry + 1} defects, the total probability of all other nations cooperating is {round(totalProbCooperate * 100, 2)}%, and")
-    print(
-        f"the total probability of all other nations defecting is {round(totalProbDefect * 100, 2)}%")
-
-    res = totalPDUtility + totalPCUtility + combinationsUtility
-    return round(res, 2)
+    with instruments.current().phase("expectedUtility", nation=thisCountry):
+        return simulation.expectedUtilityDefecting(thisCountry, method)
+
+def getExpectedUtilitiesAllNations(n, mech=False):
+    '''
+    :param n: number of players / nations
+    :param mech: if True, cooperating uses the global support mechanism (like getExpectedUtilityCooperatingMech)
+    :return: two arrays of length n, the expected utility of every nation for cooperating and for defecting. See
+    Simulation.expectedUtilitiesAllNations
+    '''
+    return getGlobalSimulation().expectedUtilitiesAllNations(mech)
+
+def decideMonteCarlo(thisCountry, n, mech=False, confidence=0.95, batchSize=1000, maxSamples=100000):
+    '''
+    :return: the choice of thisCountry estimated by sampling, see Simulation.decideMonteCarlo
+    '''
+    return getGlobalSimulation().decideMonteCarlo(thisCountry, mech, confidence, batchSize, maxSamples)
+
+def playRound(n, mech=False, output=None):
+    '''
+    :return: array of length n, True for every nation that chooses to cooperate. See Simulation.playRound
+    '''
+    return getGlobalSimulation().playRound(mech, output)
 
 if __name__ == "__main__":
 
     # basic set up
     n = int(input("How Many Players Do You Want? "))
-    players = [i for i in range(n)]
-    relationships = getRelationships(n, -0.5, 0.2)
-    reputations = getReputations(n, 0, 0.3)
+    simulation = Simulation(getReputations(n, 0, 0.3), getRelationships(n, -0.5, 0.2))
 
     print("")
     print("")
@@ -336,18 +1445,7 @@ if __name__ == "__main__":
     print("The results of these factors can be seen below.")
     print("")
 
-    for i in range(n):
-        print(f"Nation {i+1}'s turn...")
-        expCop = getExpectedUtilityCooperating(i, n)
-        expDef = getExpectedUtilityDefecting(i, n)
-        print(f"Nation {i+1}'s expected utility for cooperating is {expCop} ")
-        print(f"Nation {i+1}'s expected utility for defecting is {expDef} ")
-        if expCop > expDef:
-            print(f'{i} chooses to cooperate')
-        else:
-            print(f'{i+1} chooses to defect')
-        print("")
-        print("")
+    simulation.playRound()
 
 
     print("Part 2:")
@@ -361,22 +1459,10 @@ if __name__ == "__main__":
 
 
     # change reputation as part of our first mechanism
-    reputations = getReputations(n, 0.7, 1)
-    numCooperated = 0
+    simulation.setReputations(getReputations(n, 0.7, 1))
     print("")
 
-    for i in range(n):
-        print(f"Nation {i+1}'s turn...")
-        expCop = getExpectedUtilityCooperating(i, n)
-        expDef = getExpectedUtilityDefecting(i, n)
-        print(f"Nation {i+1}'s expected utility for cooperating is {expCop} ")
-        print(f"Nation {i+1}'s expected utility for defecting is {expDef} ")
-        if expCop > expDef:
-            print(f'{i+1} chooses to cooperate')
-        else:
-            print(f'{i+1} chooses to defect')
-        print("")
-        print("")
+    simulation.playRound()
 
     print("As we can see, if all other nations have higher reputations, everyone else will cooperate")
 
@@ -397,22 +1483,11 @@ if __name__ == "__main__":
     print("")
 
     # set reputation back to normal
-    reputations = getReputations(n, 0, 0.3)
+    simulation.setReputations(getReputations(n, 0, 0.3))
     # change relationship as part of our second mechanism
-    relationships = getRelationships(n, 0, 1)
+    simulation.setRelationships(getRelationships(n, 0, 1))
 
-    for i in range(n):
-        print(f"Nation {i+1}'s turn...")
-        expCop = getExpectedUtilityCooperating(i, n)
-        expDef = getExpectedUtilityDefecting(i, n)
-        print(f"Nation {i+1}'s expected utility for cooperating is {expCop} ")
-        print(f"Nation {i+1}'s expected utility for defecting is {expDef} ")
-        if expCop > expDef:
-            print(f'{i+1} chooses to cooperate')
-        else:
-            print(f'{i+1} chooses to defect')
-        print("")
-        print("")
+    simulation.playRound()
 
     print("As we can see, if all other nations have better relationships, everyone else will cooperate")
 
@@ -429,19 +1504,8 @@ if __name__ == "__main__":
     print("")
 
     # Set relationships back to normal
-    relationships = getRelationships(n, -0.5, 0.2)
+    simulation.setRelationships(getRelationships(n, -0.5, 0.2))
 
-    for i in range(n):
-        print(f"Nation {i+1}'s turn...")
-        expCop = getExpectedUtilityCooperatingMech(i, n)
-        expDef = getExpectedUtilityDefecting(i, n)
-        print(f"Nation {i+1}'s expected utility for cooperating is {expCop} ")
-        print(f"Nation {i+1}'s expected utility for defecting is {expDef} ")
-        if expCop > expDef:
-            print(f'{i+1} chooses to cooperate')
-        else:
-            print(f'{i+1} chooses to defect')
-        print("")
-        print("")
+    simulation.playRound(mech=True)
 
     print("As we can see, the global support mechanism increases cooperation")
@@ -0,0 +1,269 @@
+import numpy as np
+
+# rows of the relationship matrix generated at once, which bounds the temporary memory used by getRelationshipMatrix.
+# The same seed gives the same matrix as long as this stays the same
+RELATIONSHIP_BLOCK_ROWS = 1024
+
+def getReputationVector(n, lower, upper, rng=None, dtype=np.float64):
+    '''
+    :param n: number of players/nations
+    :param lower: lower range for reputation (between 0 - 1)
+    :param upper: upper range for reputation (between 0 - 1)
+    :param rng: seed or numpy random Generator
+    :param dtype: np.float64 or np.float32
+    :return: array of n reputations, the same as getReputations but drawn in one call
+    '''
+    rng = np.random.default_rng(rng)
+    return rng.uniform(lower, upper, n).astype(dtype, copy=False)
+
+def getRelationshipMatrix(n, lower, upper, rng=None, dtype=np.float64, out=None):
+    '''
+    :param n: number of players/nations
+    :param lower: a lower bound for relationships (between -1 and 1)
+    :param upper: an upper bound for relationships (between -1 and 1)
+    :param rng: seed or numpy random Generator
+    :param dtype: np.float64 or np.float32
+    :param out: n x n array to fill instead of allocating one, for example a memory-mapped file from createArray
+    :return: symmetric n x n array of relationships with zeros on the diagonal, like getRelationships
+
+    The matrix is filled RELATIONSHIP_BLOCK_ROWS rows at a time: the part right of the diagonal is drawn, and the part
+    left of it is copied from the rows above, so no temporary n x n array is needed.
+    '''
+    rng = np.random.default_rng(rng)
+    matrix = out if out is not None else np.empty((n, n), dtype=dtype)
+
+    for start in range(0, n, RELATIONSHIP_BLOCK_ROWS):
+        stop = min(n, start + RELATIONSHIP_BLOCK_ROWS)
+        # the square on the diagonal, made symmetric
+        square = np.triu(rng.uniform(lower, upper, (stop - start, stop - start)), 1)
+        matrix[start:stop, start:stop] = square + square.T
+        # right of the square
+        matrix[start:stop, stop:] = rng.uniform(lower, upper, (stop - start, n - stop))
+        # left of the square, copied from the rows above so relationships[a][b] == relationships[b][a]
+        matrix[start:stop, :start] = matrix[:start, start:stop].T
+
+    return matrix
+
+class TriangleRelationships:
+    '''
+    Relationships stored as only the part of the matrix above the diagonal, n(n - 1) / 2 values (half of the full
+    matrix). relationships[a] gives nation a's row like the map from getRelationships, so it can be used anywhere a
+    relationship map or matrix is.
+
+    This only halves the memory at rest and in IncrementalEvaluator (so runMultipleRounds and findEquilibrium), which
+    reads one nation's row at a time. Simulation builds its probability tensor from the full matrix (getLogits, see
+    relationshipMatrix), and saveCheckpoint writes the full matrix, so both expand it with toMatrix.
+    '''
+
+    def __init__(self, values, n):
+        '''
+        :param values: the n(n - 1) / 2 relationships above the diagonal, row by row
+        :param n: number of players/nations
+        '''
+        self.values = values
+        self.n = n
+
+    @classmethod
+    def generate(cls, n, lower, upper, rng=None, dtype=np.float64):
+        '''
+        :return: random relationships between lower and upper, drawn in one call
+        '''
+        rng = np.random.default_rng(rng)
+        return cls(rng.uniform(lower, upper, n * (n - 1) // 2).astype(dtype, copy=False), n)
+
+    @classmethod
+    def fromMatrix(cls, matrix):
+        n = len(matrix)
+        return cls(np.asarray(matrix)[np.triu_indices(n, 1)], n)
+
+    def index(self, a, b):
+        '''
+        :return: where the relationship between a and b (a != b, can be arrays) is in values
+        '''
+        a, b = np.minimum(a, b), np.maximum(a, b)
+        return a * self.n - (a * (a + 1)) // 2 + (b - a - 1)
+
+    def row(self, a):
+        '''
+        :return: array of nation a's relationship with every nation (0 with itself)
+        '''
+        row = np.zeros(self.n, dtype=self.values.dtype)
+        others = np.arange(self.n)
+        others = others[others != a]
+        row[others] = self.values[self.index(a, others)]
+        return row
+
+    def set(self, a, b, value):
+        self.values[self.index(a, b)] = value
+
+    def toMatrix(self):
+        matrix = np.zeros((self.n, self.n), dtype=self.values.dtype)
+        upper = np.triu_indices(self.n, 1)
+        matrix[upper] = self.values
+        return matrix + matrix.T
+
+    def __getitem__(self, a):
+        return self.row(a)
+
+    def __len__(self):
+        return self.n
+
+class BlockRelationships:
+    '''
+    Relationships given by blocs (alliances, communities): every nation belongs to a bloc, and two nations have the
+    relationship between their blocs (values[bloc of a][bloc of b], the diagonal being the relationship inside a bloc),
+    unless the pair has its own value in overrides. Memory grows with the number of blocs and overrides, not n^2.
+
+    Nations without overrides in the same bloc see everyone else the same way, so with many nations and few groups
+    Simulation.expectedUtilitiesAllNations works out their sums once per bloc (see groups and Simulation.usesGroups);
+    otherwise it expands them with toMatrix.
+    '''
+
+    def __init__(self, blocks, values, overrides=None):
+        '''
+        :param blocks: array of length n, the bloc (0 to k - 1) of every nation
+        :param values: k x k symmetric array of relationships between blocs (between -1 and 1)
+        :param overrides: map from a pair of nations (a, b) to their own relationship
+        '''
+        self.blocks = np.asarray(blocks)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.n = len(self.blocks)
+        # overrides by nation, both ways: self._overrides[a][b] == self._overrides[b][a]
+        self._overrides = {}
+        for (a, b), value in (overrides or {}).items():
+            self.set(a, b, value)
+
+    def set(self, a, b, value):
+        self._overrides.setdefault(a, {})[b] = value
+        self._overrides.setdefault(b, {})[a] = value
+
+    def blocRow(self, bloc):
+        '''
+        :return: array of the relationship of a nation in bloc (without overrides) with every nation
+        '''
+        return self.values[bloc, self.blocks]
+
+    def row(self, a):
+        '''
+        :return: array of nation a's relationship with every nation (0 with itself)
+        '''
+        row = self.blocRow(self.blocks[a])
+        for b, value in self._overrides.get(a, {}).items():
+            row[b] = value
+        row[a] = 0
+        return row
+
+    def groups(self):
+        '''
+        :return: list of (nations, row): nations that have the same relationship with every other nation, and that
+        relationship as an array of length n (the entry for each nation itself is left as it is and should be ignored).
+        Every nation without overrides is grouped with its bloc, and a nation with overrides is a group of its own
+        '''
+        overridden = np.zeros(self.n, dtype=bool)
+        overridden[list(self._overrides)] = True
+        groups = []
+        for bloc in range(len(self.values)):
+            nations = np.flatnonzero((self.blocks == bloc) & ~overridden)
+            if len(nations):
+                groups.append((nations, self.blocRow(bloc)))
+        for a in np.flatnonzero(overridden):
+            groups.append((np.array([a]), self.row(a)))
+        return groups
+
+    def groupCount(self):
+        '''
+        :return: the number of groups groups() gives, without building their rows
+        '''
+        overridden = np.zeros(self.n, dtype=bool)
+        overridden[list(self._overrides)] = True
+        return len(np.unique(self.blocks[~overridden])) + int(overridden.sum())
+
+    def toMatrix(self):
+        matrix = self.values[np.ix_(self.blocks, self.blocks)]
+        for a, row in self._overrides.items():
+            for b, value in row.items():
+                matrix[a, b] = value
+        np.fill_diagonal(matrix, 0)
+        return matrix
+
+    def __getitem__(self, a):
+        return self.row(a)
+
+    def __len__(self):
+        return self.n
+
+class SparseRelationships(BlockRelationships):
+    '''
+    A default relationship for every pair of nations, and a few pairs with their own (see BlockRelationships).
+    '''
+
+    def __init__(self, n, default=0, overrides=None):
+        '''
+        :param n: number of players/nations
+        :param default: relationship between nations without an override
+        :param overrides: map from a pair of nations (a, b) to their own relationship
+        '''
+        super().__init__(np.zeros(n, dtype=int), [[default]], overrides)
+
+# relationship stores that are not plain arrays; each has row, set, toMatrix and relationships[a]
+STORES = (TriangleRelationships, BlockRelationships)
+
+def asReputations(reputations):
+    '''
+    :param reputations: map (from getReputations) or array of reputations
+    :return: the reputations as an array (arrays are used as they are, without copying)
+    '''
+    if isinstance(reputations, np.ndarray):
+        return reputations
+    return np.array([reputations[i] for i in range(len(reputations))], dtype=np.float64)
+
+def asRelationships(relationships):
+    '''
+    :param relationships: map (from getRelationships), 2D array, or a store (see STORES)
+    :return: the relationships as a 2D array, or the store itself (arrays and stores are used without copying)
+    '''
+    if isinstance(relationships, (np.ndarray,) + STORES):
+        return relationships
+    return np.array([relationships[i] for i in range(len(relationships))], dtype=np.float64)
+
+def relationshipMatrix(relationships):
+    '''
+    :return: the relationships (map, array or store) as a full 2D array
+    '''
+    relationships = asRelationships(relationships)
+    if isinstance(relationships, np.ndarray):
+        return relationships
+    return relationships.toMatrix()
+
+def setRelationship(relationships, a, b, value):
+    '''
+    Sets the relationship between a and b (both ways) in a 2D array or a store.
+    '''
+    if isinstance(relationships, np.ndarray):
+        relationships[a, b] = value
+        relationships[b, a] = value
+    else:
+        relationships.set(a, b, value)
+
+def createArray(path, shape, dtype=np.float64):
+    '''
+    :param path: .npy file to create
+    :param shape: shape of the array
+    :param dtype: np.float64 or np.float32
+    :return: a writable array backed by the file, for example to pass as out to getRelationshipMatrix
+    '''
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+def saveArray(path, array):
+    '''
+    Saves an array of reputations, relationships or the values of a TriangleRelationships as a .npy file.
+    '''
+    np.save(path, array)
+
+def loadArray(path, mmap=True):
+    '''
+    :param path: .npy file from saveArray or createArray
+    :param mmap: if True, the array is memory-mapped (copy on write), so it is only read from disk as it is used
+    :return: the array
+    '''
+    return np.load(path, mmap_mode="c" if mmap else None)
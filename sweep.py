@@ -0,0 +1,222 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import simulationv2
+from cache import ResultCache, hashKey
+from output import Output
+from payoffs import PAYOFFS
+from rounds import runMultipleRounds
+
+# every scenario is a dict with these keys; anything left out gets the default
+DEFAULT_SCENARIO = {
+    "n": 5,
+    "reputations": (0, 0.3),
+    "relationships": (-0.5, 0.2),
+    "bonus": 0,
+    "rounds": 0,
+    "seed": 0,
+    "weights": simulationv2.WEIGHTS,
+    "bias": simulationv2.BIAS,
+    "payoff": "log",
+    "precision": "float64",
+    "logSpace": False,
+}
+
+# the four Parts of simulationv2.py as scenarios (Part 2 raises the reputations, Part 3 improves the relationships
+# and Part 4 adds the global support mechanism)
+PARTS = {
+    "part1": {"reputations": (0, 0.3), "relationships": (-0.5, 0.2)},
+    "part2": {"reputations": (0.7, 1), "relationships": (-0.5, 0.2)},
+    "part3": {"reputations": (0, 0.3), "relationships": (0, 1)},
+    "part4": {"reputations": (0, 0.3), "relationships": (-0.5, 0.2), "bonus": 50},
+}
+
+# columns of the results table, after the scenario's own columns
+RESULT_COLUMNS = ("cooperationRate", "meanExpCooperating", "meanExpDefecting", "finalCooperationRate",
+                  "meanCooperationRate")
+
+def makeGrid(n=(5,), reputations=((0, 0.3),), relationships=((-0.5, 0.2),), bonus=(0,), rounds=(0,), seeds=(0,),
+             payoffs=("log",)):
+    '''
+    :param n: numbers of players / nations to try
+    :param reputations: (lower, upper) reputation ranges to try
+    :param relationships: (lower, upper) relationship ranges to try
+    :param bonus: global support mechanism bonuses to try (0 means no mechanism)
+    :param rounds: numbers of rounds to try (0 means one pass where every nation decides once, like the Parts)
+    :param seeds: random seeds to try
+    :param payoffs: names of payoff models to try (see payoffs.PAYOFFS)
+    :return: list of scenarios, one for every combination of the values above
+    '''
+    return [{"n": size, "reputations": reputationRange, "relationships": relationshipRange, "bonus": extra,
+             "rounds": numRounds, "seed": seed, "payoff": payoff}
+            for size, reputationRange, relationshipRange, extra, numRounds, seed, payoff
+            in itertools.product(n, reputations, relationships, bonus, rounds, seeds, payoffs)]
+
+def makeSimulation(scenario):
+    '''
+    :param scenario: dict with the scenario's settings (see DEFAULT_SCENARIO)
+    :return: the scenario's Simulation, with reputations and relationships drawn from its seed
+    '''
+    settings = dict(DEFAULT_SCENARIO, **scenario)
+    lower, upper = settings["reputations"]
+    relationshipLower, relationshipUpper = settings["relationships"]
+    return simulationv2.Simulation.generate(settings["n"], (lower, upper), (relationshipLower, relationshipUpper),
+                                            settings["seed"], weights=settings["weights"], bias=settings["bias"],
+                                            bonus=settings["bonus"], payoff=PAYOFFS[settings["payoff"]],
+                                            precision=settings["precision"], logSpace=settings["logSpace"])
+
+def scenarioResults(scenario):
+    '''
+    :param scenario: dict with the scenario's settings (see DEFAULT_SCENARIO)
+    :return: dict of arrays: every nation's expected utilities for cooperating and defecting ("expCooperating",
+    "expDefecting") and choice ("cooperates") when every nation decides once, and the cooperation percentage of every
+    round if the scenario has rounds ("history", see runMultipleRounds; empty otherwise)
+    '''
+    settings = dict(DEFAULT_SCENARIO, **scenario)
+    simulation = makeSimulation(settings)
+
+    mech = settings["bonus"] != 0
+    expCooperating, expDefecting = simulation.expectedUtilitiesAllNations(mech)
+    results = {"expCooperating": np.asarray(expCooperating), "expDefecting": np.asarray(expDefecting),
+               "cooperates": simulation.cooperatesAllNations(expCooperating, expDefecting, mech),
+               "history": np.array([])}
+
+    if settings["rounds"] > 0:
+        _, cooperationHistory = runMultipleRounds(simulation.reputations, simulation.relationships,
+                                                  settings["rounds"], weights=simulation.weights, bias=simulation.bias,
+                                                  mech=mech, bonus=simulation.bonus, output=Output(),
+                                                  payoff=simulation.payoff)
+        results["history"] = np.array(cooperationHistory)
+    return results
+
+def cacheKey(scenario):
+    '''
+    :return: the scenario's key in a ResultCache: a hash of all its settings (with the defaults filled in) and of
+    its payoff model's constants, so editing a model's constants doesn't give back old results
+    '''
+    settings = dict(DEFAULT_SCENARIO, **scenario)
+    model = PAYOFFS[settings["payoff"]]
+    settings["payoffModel"] = [type(model).__name__, vars(model)]
+    return hashKey(settings)
+
+def summarize(scenario, results):
+    '''
+    :param scenario: dict with the scenario's settings (see DEFAULT_SCENARIO)
+    :param results: the scenario's arrays from scenarioResults
+    :return: dict with the scenario's settings and its results (see runScenario)
+    '''
+    result = dict(DEFAULT_SCENARIO, **scenario)
+    result["cooperationRate"] = float(np.mean(results["cooperates"]) * 100)
+    result["meanExpCooperating"] = float(np.mean(results["expCooperating"]))
+    result["meanExpDefecting"] = float(np.mean(results["expDefecting"]))
+    if len(results["history"]):
+        result["finalCooperationRate"] = float(results["history"][-1])
+        result["meanCooperationRate"] = float(np.mean(results["history"]))
+    return result
+
+def runScenario(scenario, cache=None):
+    '''
+    :param scenario: dict with the scenario's settings (see DEFAULT_SCENARIO)
+    :param cache: ResultCache (see cache.py) to look the scenario up in first, and to keep its results in
+    :return: dict with the scenario's settings and its results
+
+    Results are the percentage of nations that cooperate and the mean expected utilities when every nation decides once.
+    If the scenario has rounds, it also plays them (see runMultipleRounds) and gives the cooperation percentage of
+    the last round and the mean over all rounds.
+    '''
+    if cache is None:
+        return summarize(scenario, scenarioResults(scenario))
+    return summarize(scenario, cache.fetch(cacheKey(scenario), lambda: scenarioResults(scenario)))
+
+def runSweep(scenarios, workers=None, cache=None):
+    '''
+    :param scenarios: list of scenarios (see makeGrid and DEFAULT_SCENARIO)
+    :param workers: number of worker processes, all cores by default. 1 runs everything in this process
+    (scenarios share no state, so they can also be run from threads with runScenario)
+    :param cache: ResultCache (see cache.py). Scenarios found in it are not run again, and the others are added
+    :return: list of results (see runScenario), in the same order as scenarios
+    '''
+    results = [cache.get(cacheKey(scenario)) if cache is not None else None for scenario in scenarios]
+    missing = [i for i, found in enumerate(results) if found is None]
+
+    if workers == 1 or len(missing) <= 1:
+        computed = [scenarioResults(scenarios[i]) for i in missing]
+    else:
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # hand out scenarios in chunks so small ones don't wait on the pool
+            computed = list(pool.map(scenarioResults, [scenarios[i] for i in missing],
+                                     chunksize=max(1, len(missing) // (workers * 4))))
+
+    for i, found in zip(missing, computed):
+        results[i] = found
+        if cache is not None:
+            cache.put(cacheKey(scenarios[i]), found)
+    return [summarize(scenario, found) for scenario, found in zip(scenarios, results)]
+
+def writeResults(results, file):
+    '''
+    :param results: list of results from runSweep
+    :param file: open text file to write the results table to, as CSV
+    '''
+    columns = list(DEFAULT_SCENARIO) + list(RESULT_COLUMNS)
+    writer = csv.DictWriter(file, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for result in results:
+        writer.writerow(result)
+
+def parseRange(text):
+    '''
+    :param text: a range written as "lower,upper"
+    :return: (lower, upper)
+    '''
+    lower, upper = text.split(",")
+    return float(lower), float(upper)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a grid (or list) of scenarios across all cores and write one "
+                                                 "results table as CSV.")
+    parser.add_argument("--scenarios", help="JSON file with a list of scenarios (see DEFAULT_SCENARIO), used "
+                                            "instead of the grid options")
+    parser.add_argument("--parts", action="store_true", help="run the four Parts of simulationv2.py (see PARTS) for "
+                                                              "every n and seed, instead of the grid options")
+    parser.add_argument("--n", type=int, nargs="+", default=[5], help="numbers of nations")
+    parser.add_argument("--reputations", type=parseRange, nargs="+", default=[(0, 0.3)],
+                        help="reputation ranges as lower,upper")
+    parser.add_argument("--relationships", type=parseRange, nargs="+", default=[(-0.5, 0.2)],
+                        help="relationship ranges as lower,upper")
+    parser.add_argument("--bonus", type=float, nargs="+", default=[0], help="global support bonuses (0 for none)")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[0], help="numbers of rounds (0 for a single pass)")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="random seeds")
+    parser.add_argument("--payoffs", nargs="+", default=["log"], choices=sorted(PAYOFFS), help="payoff models")
+    parser.add_argument("--workers", type=int, help="number of worker processes (all cores by default)")
+    parser.add_argument("--output", help="CSV file to write (standard output by default)")
+    parser.add_argument("--cache", help="directory of cached scenario results, reused across runs (see cache.py)")
+    args = parser.parse_args(argv)
+
+    if args.scenarios:
+        with open(args.scenarios) as file:
+            scenarios = json.load(file)
+    elif args.parts:
+        scenarios = [dict(part, n=n, seed=seed) for n in args.n for seed in args.seeds for part in PARTS.values()]
+    else:
+        scenarios = makeGrid(args.n, args.reputations, args.relationships, args.bonus, args.rounds, args.seeds,
+                             args.payoffs)
+
+    cache = ResultCache(args.cache) if args.cache else None
+    results = runSweep(scenarios, args.workers, cache)
+    if args.output:
+        with open(args.output, "w", newline="") as file:
+            writeResults(results, file)
+    else:
+        writeResults(results, sys.stdout)
+
+if __name__ == "__main__":
+    main()
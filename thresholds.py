@@ -0,0 +1,118 @@
+import numpy as np
+
+from rounds import IncrementalEvaluator
+from simulationv2 import WEIGHTS, BIAS
+
+def bisectThresholds(cooperates, lower, upper, tolerance):
+    '''
+    :param cooperates: function from a value (bonus, reputation floor, ...) to an array of length n, True for every
+    nation that cooperates at that value. Nations are assumed to keep cooperating once the value is high enough
+    :param lower: smallest value to try
+    :param upper: largest value to try
+    :param tolerance: how close to the true threshold the answers need to be
+    :return: (thresholds, population, probes): array of length n with the smallest value at which each nation
+    cooperates (inf if it doesn't even at upper), the smallest value at which every nation cooperates (inf if there
+    is none up to upper), and the number of times cooperates was called
+
+    Every nation's interval is halved until it is smaller than tolerance. Each value is only tried once, and nations
+    whose intervals are the same share the same call, so nations that switch together cost one bisection between them.
+    '''
+    results = {}
+
+    def probe(value):
+        if value not in results:
+            results[value] = np.asarray(cooperates(value), dtype=bool)
+        return results[value]
+
+    atLower, atUpper = probe(lower), probe(upper)
+    n = len(atUpper)
+    low = np.full(n, float(lower))
+    high = np.where(atUpper, float(upper), np.inf)
+    high[atLower] = lower
+
+    active = np.isfinite(high) & (high - low > tolerance)
+    while active.any():
+        for intervalLow, intervalHigh in np.unique(np.stack([low[active], high[active]], axis=1), axis=0):
+            middle = (intervalLow + intervalHigh) / 2
+            switched = probe(middle)
+            members = active & (low == intervalLow) & (high == intervalHigh)
+            high[members & switched] = middle
+            low[members & ~switched] = middle
+        active = np.isfinite(high) & (high - low > tolerance)
+
+    # the whole population, checked directly in case some nation stops cooperating again as the value grows
+    if not atUpper.all():
+        population = np.inf
+    elif atLower.all():
+        population = lower
+    else:
+        populationLow, populationHigh = max(lower, float(np.max(low))), float(upper)
+        if probe(float(np.max(high))).all():
+            populationHigh = float(np.max(high))
+        while populationHigh - populationLow > tolerance:
+            middle = (populationLow + populationHigh) / 2
+            if probe(middle).all():
+                populationHigh = middle
+            else:
+                populationLow = middle
+        population = populationHigh
+
+    return high, population, len(results)
+
+def bonusThresholds(simulation, upper=1000, tolerance=0.01):
+    '''
+    :param simulation: a Simulation
+    :param upper: largest bonus to try
+    :param tolerance: how close to the true thresholds the answers need to be
+    :return: (thresholds, population, probes), see bisectThresholds: the smallest global support bonus (extra util
+    points for cooperating, see cooperatingUtilityMech) that makes each nation cooperate, and every nation
+
+    The bonus doesn't change any probability, so the combinations are summed once (Simulation.bonusTerms) and each
+    probe only works out n straight lines, rounded like expectedUtilitiesAllNations. The lines are in floats, so
+    if any nation's utilities are beyond the float range (roughly a thousand nations with high reputations) this
+    raises an OverflowError instead of taking inf for "never cooperates".
+    '''
+    n = simulation.n
+    cooperatingTable, defectingTable = simulation.payoffTables()
+    with np.errstate(over="ignore", invalid="ignore"):
+        base, perBonus, totalProbCooperate = simulation.bonusTerms()
+    expDefecting = simulation.expectedUtilitiesForChoice(1)
+    overflowed = ~(np.isfinite(base) & np.isfinite(perBonus) & np.isfinite(expDefecting))
+    if overflowed.any():
+        raise OverflowError(f"The expected utilities of {np.count_nonzero(overflowed)} of the {n} nations are beyond "
+                            f"the float range, so their bonus thresholds can't be found")
+    totalProbDefect = simulation.allOthersProbabilitiesAllNations(0)[1]
+    defectingTerm = totalProbDefect * defectingTable[n - 1]
+
+    def cooperates(bonus):
+        combinations = np.round(base + (bonus * perBonus), 2)
+        expCooperating = defectingTerm + (totalProbCooperate * (cooperatingTable[0] + bonus)) + combinations
+        return np.round(expCooperating, 2) > expDefecting
+
+    return bisectThresholds(cooperates, 0, upper, tolerance)
+
+def reputationFloorThresholds(reputations, relationships, weights=WEIGHTS, bias=BIAS, mech=False, bonus=50,
+                              tolerance=0.001, payoff=None):
+    '''
+    :param reputations: map (or array) of reputations
+    :param relationships: map, 2D array or store of relationships
+    :param weights: weights for the probability function
+    :param bias: constant added inside the probability function
+    :param mech: if True, cooperating uses the global support mechanism
+    :param bonus: extra util points for cooperating when mech is set
+    :param tolerance: how close to the true thresholds the answers need to be
+    :param payoff: PayoffModel for the utilities (see payoffs.py), the readMe's log model by default
+    :return: (thresholds, population, probes), see bisectThresholds: the smallest reputation floor (every reputation
+    below it is raised to it) that makes each nation cooperate, and every nation
+
+    Probes go through one IncrementalEvaluator, so a probe only redoes the sums of the nations whose reputations it
+    actually moved. Late in the search the floors are close together and only a few reputations change.
+    '''
+    evaluator = IncrementalEvaluator(reputations, relationships, weights, bias, mech, bonus, payoff=payoff)
+    original = evaluator.reputations.copy()
+
+    def cooperates(floor):
+        evaluator.setReputations(np.maximum(original, floor))
+        return np.array([evaluator.decide(i)[2] for i in range(evaluator.n)])
+
+    return bisectThresholds(cooperates, 0, 1, tolerance)